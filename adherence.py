@@ -1,4 +1,4 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from typing import List, Dict, Any, Optional
 from schemas import PrescriptionResponse, UsageResponse
 from collections import defaultdict
@@ -75,9 +75,38 @@ def calculate_adherence(
     ]
     
     # Group usage logs by date
-    usage_by_date = defaultdict(list)
+    usage_by_date = defaultdict(int)
     for log in relevant_logs:
-        usage_by_date[log.taken_at.date()].append(log)
+        usage_by_date[log.taken_at.date()] += 1
+    
+    return calculate_adherence_from_counts(prescription, usage_by_date, start_date, end_date)
+
+def calculate_adherence_from_counts(
+    prescription: PrescriptionResponse,
+    doses_by_date: Dict[date, int],
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+) -> AdherenceResult:
+    """
+    Calculate prescription adherence from per-day dose counts.
+    
+    This is the core of calculate_adherence for callers that already have the
+    number of doses taken on each day (e.g. from archived usage bitmaps) and
+    do not need to materialise individual usage logs.
+    
+    Args:
+        prescription: The prescription to evaluate
+        doses_by_date: Number of doses taken on each date within the evaluation period
+        start_date: Start date for evaluation (defaults to prescription start_date)
+        end_date: End date for evaluation (defaults to current time or prescription end_date)
+    
+    Returns:
+        AdherenceResult containing adherence metrics and details
+    """
+    if start_date is None:
+        start_date = prescription.start_date
+    if end_date is None:
+        end_date = prescription.end_date or datetime.now()
     
     # Calculate expected and actual doses for each day
     current_date = start_date.date()
@@ -91,7 +120,7 @@ def calculate_adherence(
     expected_doses_for_day = prescription.times_per_day
     
     while current_date <= end_date:
-        actual_doses_for_day = len(usage_by_date[current_date])
+        actual_doses_for_day = doses_by_date.get(current_date, 0)
         
         total_expected += expected_doses_for_day
         total_taken += actual_doses_for_day
@@ -0,0 +1,114 @@
+"""
+Benchmark chunked bulk import against one-request-at-a-time inserts.
+
+Generates a synthetic clinic as JSONL, imports it with bulk_import, and
+times the per-record path the API offers today (email lookup, commit and
+refresh for every user and prescription) on a sample for comparison.
+
+    python benchmarks/bench_bulk_import.py --users 20000
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import models  # noqa: E402
+from bulk_import import DEFAULT_CHUNK_SIZE, import_jsonl  # noqa: E402
+
+
+def generate(users: int, prescriptions_per_user: int, usage_per_prescription: int) -> bytes:
+    out = io.StringIO()
+    start = datetime(2023, 1, 1)
+    prescription_id = 0
+    for user_id in range(users):
+        out.write(json.dumps({
+            "record_type": "user", "id": user_id,
+            "email": f"patient{user_id}@clinic.example", "full_name": f"Patient {user_id}"
+        }) + "\n")
+        for _ in range(prescriptions_per_user):
+            prescription_id += 1
+            out.write(json.dumps({
+                "record_type": "prescription", "id": prescription_id, "user_id": user_id,
+                "medication_name": "Synthetic", "dosage": "10mg", "pills_per_dose": 1,
+                "times_per_day": 1, "start_date": start.isoformat()
+            }) + "\n")
+            for day in range(usage_per_prescription):
+                out.write(json.dumps({
+                    "record_type": "usage", "user_id": user_id, "prescription_id": prescription_id,
+                    "taken_at": (start + timedelta(days=day, hours=8)).isoformat()
+                }) + "\n")
+        out.write(json.dumps({
+            "record_type": "check_in", "user_id": user_id, "transcript": "Doing well.",
+            "side_effects": [], "red_flags": [], "mood": 7, "clinical_effectiveness": []
+        }) + "\n")
+    return out.getvalue().encode("utf-8")
+
+
+def one_at_a_time(db, users: int, prescriptions_per_user: int) -> int:
+    """Mirror of POST /users/ followed by POST /users/{id}/prescriptions/"""
+    rows = 0
+    for user_index in range(users):
+        email = f"single{user_index}@clinic.example"
+        db.query(models.User).filter(models.User.email == email).first()
+        user = models.User(email=email, full_name=f"Single {user_index}")
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        rows += 1
+        for _ in range(prescriptions_per_user):
+            db.query(models.User).filter(models.User.id == user.id).first()
+            prescription = models.Prescription(
+                user_id=user.id, medication_name="Synthetic", dosage="10mg",
+                pills_per_dose=1, times_per_day=1, start_date=datetime(2023, 1, 1)
+            )
+            db.add(prescription)
+            db.commit()
+            db.refresh(prescription)
+            rows += 1
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--prescriptions-per-user", type=int, default=2)
+    parser.add_argument("--usage-per-prescription", type=int, default=30)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--baseline-users", type=int, default=500, help="Users to insert one at a time")
+    args = parser.parse_args()
+
+    data = generate(args.users, args.prescriptions_per_user, args.usage_per_prescription)
+    records = data.count(b"\n")
+    print(f"Generated {records:,} records ({len(data) / 1e6:.1f} MB)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        models.Base.metadata.create_all(bind=engine)
+        db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+        report = import_jsonl(
+            db, io.BytesIO(data), "bench", args.chunk_size,
+            progress=lambda lines, rate: print(f"  {lines:>10,} lines  {rate:>10,.0f} rows/s", end="\r")
+        )
+        print()
+        print(f"Bulk import: {report.inserted} in {report.elapsed_seconds:.1f}s "
+              f"({report.rows_per_second:,.0f} rows/s)")
+
+        began = time.perf_counter()
+        rows = one_at_a_time(db, args.baseline_users, args.prescriptions_per_user)
+        elapsed = time.perf_counter() - began
+        print(f"One at a time: {rows} users and prescriptions in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark streamed check-in ingestion with many concurrent voice sessions.
+
+Drives the check-in WebSocket endpoint directly over ASGI from one event loop,
+as a production server would, with every session sending transcript chunks
+interleaved with the others. Reports chunk throughput, transcript writes and
+peak RSS growth for the batched writer, then repeats the run writing every
+chunk as it arrives for comparison.
+
+    python benchmarks/bench_check_in_stream.py --sessions 200 --chunks 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi import FastAPI  # noqa: E402
+from sqlalchemy import create_engine, event  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import check_in_stream  # noqa: E402
+import models  # noqa: E402
+from database import get_db  # noqa: E402
+from routes import check_ins  # noqa: E402
+
+METADATA = {"mood": 6, "side_effects": [], "red_flags": [], "clinical_effectiveness": []}
+
+
+def build_app(path: str):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 60})
+    models.Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = factory()
+    db.add(models.User(email="bench@example.com", full_name="Bench User"))
+    db.commit()
+    db.close()
+
+    app = FastAPI()
+    app.include_router(check_ins.router)
+
+    def override_get_db():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    return app, engine
+
+
+async def voice_session(app, chunks: int, text: str):
+    incoming = asyncio.Queue()
+    scope = {
+        "type": "websocket", "asgi": {"version": "3.0"}, "scheme": "ws", "path": "/users/1/check-ins/stream",
+        "raw_path": b"/users/1/check-ins/stream", "query_string": b"", "root_path": "", "headers": [],
+        "client": ("bench", 50000), "server": ("bench", 80), "subprotocols": [],
+    }
+
+    async def send(message):
+        pass
+
+    async def client():
+        await incoming.put({"type": "websocket.connect"})
+        for seq in range(1, chunks + 1):
+            await incoming.put({"type": "websocket.receive", "text": json.dumps({"type": "chunk", "seq": seq, "text": text})})
+            await asyncio.sleep(0)
+        await incoming.put({"type": "websocket.receive", "text": json.dumps({"type": "finalize", **METADATA})})
+
+    await asyncio.gather(app(scope, incoming.get, send), client())
+
+
+def peak_rss_bytes() -> int:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run(label: str, sessions: int, chunks: int, text: str):
+    with tempfile.TemporaryDirectory() as tmp:
+        app, engine = build_app(os.path.join(tmp, "bench.db"))
+        writes = []
+        event.listen(
+            engine, "before_cursor_execute",
+            lambda conn, cursor, statement, *args: writes.append(1) if statement.startswith("UPDATE check_ins") else None
+        )
+
+        async def run_all():
+            await asyncio.gather(*(voice_session(app, chunks, text) for _ in range(sessions)))
+
+        rss_before = peak_rss_bytes()
+        began = time.perf_counter()
+        asyncio.run(run_all())
+        elapsed = time.perf_counter() - began
+        grown = peak_rss_bytes() - rss_before
+        engine.dispose()
+
+    total = sessions * chunks
+    print(f"{label}: {total:,} chunks from {sessions} sessions in {elapsed:.1f}s "
+          f"({total / elapsed:,.0f} chunks/s), {len(writes):,} transcript writes, peak RSS +{grown / 1e6:.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--chunks", type=int, default=100)
+    parser.add_argument("--chunk-chars", type=int, default=120)
+    args = parser.parse_args()
+
+    text = ("lorem ipsum " * (args.chunk_chars // 12 + 1))[:args.chunk_chars]
+    run(f"Batched (flush at {check_in_stream.FLUSH_CHARS} chars or {check_in_stream.FLUSH_SECONDS:g}s)",
+        args.sessions, args.chunks, text)
+    check_in_stream.FLUSH_CHARS = 0
+    run("Per-chunk writes", args.sessions, args.chunks, text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark the dose scheduler at one million scheduled doses.
+
+Loads synthetic prescriptions with random dose times into a DoseScheduler,
+then reports heap build time, peak RSS growth while building it, the cost of
+one-minute ticks over a simulated day, and /next-doses lookup latency.
+
+    python benchmarks/bench_dose_scheduler.py --prescriptions 1000000
+"""
+import argparse
+import gc
+import os
+import random
+import resource
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from dose_scheduler import DoseScheduler, ReminderSink  # noqa: E402
+
+
+class CountingSink(ReminderSink):
+    def __init__(self):
+        self.sent = 0
+
+    def send(self, reminder):
+        self.sent += 1
+
+
+def synthetic_prescriptions(count: int, users: int):
+    rng = random.Random(42)
+    # A few hundred distinct schedules, shared like real prescribing patterns
+    schedules = [
+        [f"{rng.randrange(6, 23):02d}:{rng.randrange(0, 60, 5):02d}" for _ in range(rng.choice([1, 2, 3]))]
+        for _ in range(500)
+    ]
+    for prescription_id in range(1, count + 1):
+        yield SimpleNamespace(
+            id=prescription_id,
+            user_id=rng.randrange(users),
+            medication_name="Synthetic",
+            dosage="10mg",
+            times_per_day=None,
+            start_date=datetime(2024, 1, 1),
+            end_date=None,
+            prescription_metadata={"dose_times": rng.choice(schedules)}
+        )
+
+
+def peak_rss_bytes() -> int:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--prescriptions", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=300_000)
+    parser.add_argument("--lookups", type=int, default=10_000)
+    args = parser.parse_args()
+
+    prescriptions = list(synthetic_prescriptions(args.prescriptions, args.users))
+    sink = CountingSink()
+    scheduler = DoseScheduler(sink=sink)
+    now = datetime(2024, 6, 1, 0, 0)
+
+    gc.collect()
+    rss_before = peak_rss_bytes()
+    began = time.perf_counter()
+    scheduler.load_prescriptions(prescriptions, now=now)
+    build_seconds = time.perf_counter() - began
+    held = peak_rss_bytes() - rss_before
+    print(f"Loaded {len(scheduler):,} prescriptions in {build_seconds:.1f}s, "
+          f"peak RSS +{held / 1e6:.0f} MB ({held / len(scheduler):.0f} B per prescription)")
+
+    tick_ms = []
+    for minute in range(1, 24 * 60 + 1):
+        began = time.perf_counter()
+        scheduler.tick(now + timedelta(minutes=minute))
+        tick_ms.append((time.perf_counter() - began) * 1e3)
+    idle = [ms for ms in tick_ms if ms < 0.05]
+    print(f"One day of 1-minute ticks sent {sink.sent:,} reminders: "
+          f"mean {statistics.mean(tick_ms):.2f} ms, p99 {sorted(tick_ms)[int(len(tick_ms) * 0.99)]:.2f} ms, "
+          f"max {max(tick_ms):.2f} ms, {len(idle)} idle ticks, "
+          f"{sum(tick_ms) * 1e3 / max(sink.sent, 1):.1f} us per reminder")
+
+    rng = random.Random(7)
+    began = time.perf_counter()
+    for _ in range(args.lookups):
+        scheduler.next_doses(rng.randrange(args.users))
+    print(f"next_doses: {(time.perf_counter() - began) / args.lookups * 1e6:.1f} us per lookup")
+
+    began = time.perf_counter()
+    for prescription_id in rng.sample(range(1, args.prescriptions + 1), args.lookups):
+        scheduler.record_usage(prescription_id, now + timedelta(days=1, hours=rng.randrange(24)))
+    print(f"record_usage: {(time.perf_counter() - began) / args.lookups * 1e6:.1f} us per update")
+
+
+if __name__ == "__main__":
+    main()
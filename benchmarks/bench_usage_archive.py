@@ -0,0 +1,136 @@
+"""
+Benchmark usage archive compaction on a synthetic multi-year dataset.
+
+Builds a throwaway SQLite database, measures its size and the cost of the
+adherence and usage-listing reads, compacts everything older than the
+horizon, then measures again.
+
+    python benchmarks/bench_usage_archive.py --users 50 --years 3
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import models  # noqa: E402
+import usage_archive  # noqa: E402
+
+
+def populate(db, users: int, prescriptions_per_user: int, start: datetime, end: datetime) -> int:
+    rng = random.Random(42)
+    rows = 0
+    for user_index in range(users):
+        user = models.User(email=f"user{user_index}@example.com", full_name=f"User {user_index}")
+        db.add(user)
+        db.flush()
+        for _ in range(prescriptions_per_user):
+            times_per_day = rng.choice([1, 2, 3])
+            prescription = models.Prescription(
+                user_id=user.id,
+                medication_name="Synthetic",
+                dosage="10mg",
+                pills_per_dose=1,
+                times_per_day=times_per_day,
+                start_date=start,
+                end_date=end
+            )
+            db.add(prescription)
+            db.flush()
+
+            batch = []
+            day = start
+            while day < end:
+                for slot in range(times_per_day):
+                    if rng.random() < 0.9:
+                        taken_at = day + timedelta(hours=8 + slot * 6, seconds=rng.randrange(3600))
+                        batch.append({
+                            "user_id": user.id,
+                            "prescription_id": prescription.id,
+                            "taken_at": taken_at,
+                            "created_at": taken_at + timedelta(seconds=rng.randrange(120))
+                        })
+                day += timedelta(days=1)
+            db.execute(insert(models.Usage), batch)
+            rows += len(batch)
+        db.commit()
+    return rows
+
+
+def database_size(engine) -> int:
+    with engine.connect() as connection:
+        connection.execute(text("VACUUM"))
+        page_count = connection.execute(text("PRAGMA page_count")).scalar()
+        page_size = connection.execute(text("PRAGMA page_size")).scalar()
+    return page_count * page_size
+
+
+def time_reads(db, prescriptions, start: datetime, end: datetime, repeat: int):
+    adherence = 0.0
+    listing = 0.0
+    for _ in range(repeat):
+        for prescription in prescriptions:
+            began = time.perf_counter()
+            usage_archive.usage_counts_by_date(db, prescription.user_id, prescription.id, start, end)
+            adherence += time.perf_counter() - began
+
+            began = time.perf_counter()
+            usage_archive.get_usage_logs(db, prescription.user_id, prescription.id, start, end)
+            listing += time.perf_counter() - began
+    calls = repeat * len(prescriptions)
+    return adherence / calls, listing / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--prescriptions-per-user", type=int, default=2)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--horizon-days", type=int, default=90)
+    parser.add_argument("--sample", type=int, default=20, help="Prescriptions to time reads on")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    end = datetime(2024, 1, 1)
+    start = end - timedelta(days=365 * args.years)
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        models.Base.metadata.create_all(bind=engine)
+        db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+        began = time.perf_counter()
+        rows = populate(db, args.users, args.prescriptions_per_user, start, end)
+        print(f"Inserted {rows} usage rows in {time.perf_counter() - began:.1f}s")
+
+        sample = db.query(models.Prescription).limit(args.sample).all()
+        size_before = database_size(engine)
+        adherence_before, listing_before = time_reads(db, sample, start, end, args.repeat)
+
+        began = time.perf_counter()
+        result = usage_archive.compact_usage(db, horizon_days=args.horizon_days, now=end)
+        compact_seconds = time.perf_counter() - began
+
+        size_after = database_size(engine)
+        adherence_after, listing_after = time_reads(db, sample, start, end, args.repeat)
+        db.close()
+
+    print(f"Compacted {result.rows_archived} rows into {result.months_written} monthly rows "
+          f"in {compact_seconds:.1f}s ({result.rows_archived / compact_seconds:,.0f} rows/s)")
+    print(f"Database size: {size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB "
+          f"({100 * (1 - size_after / size_before):.0f}% smaller)")
+    print(f"Adherence read: {adherence_before * 1e3:.1f} ms -> {adherence_after * 1e3:.1f} ms "
+          f"({adherence_before / adherence_after:.1f}x)")
+    print(f"Usage listing:  {listing_before * 1e3:.1f} ms -> {listing_after * 1e3:.1f} ms "
+          f"({listing_before / listing_after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark streaming export throughput for a user with millions of usage rows.
+
+Builds a throwaway SQLite database holding one heavy user, then streams the
+export in each format and reports rows/s, output size and peak RSS growth.
+
+    python benchmarks/bench_user_export.py --usage-rows 2000000
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import models  # noqa: E402
+from user_export import DEFAULT_BATCH_SIZE, stream_user_export  # noqa: E402
+
+
+def populate(url: str, usage_rows: int, check_ins: int) -> None:
+    engine = create_engine(url)
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    user = models.User(email="heavy@example.com", full_name="Heavy User")
+    db.add(user)
+    db.flush()
+    prescription = models.Prescription(
+        user_id=user.id,
+        medication_name="Synthetic",
+        dosage="10mg",
+        pills_per_dose=1,
+        times_per_day=4,
+        start_date=datetime(2000, 1, 1)
+    )
+    db.add(prescription)
+    db.flush()
+
+    start = datetime(2000, 1, 1)
+    for offset in range(0, usage_rows, 50_000):
+        db.execute(insert(models.Usage), [
+            {
+                "user_id": user.id,
+                "prescription_id": prescription.id,
+                "taken_at": start + timedelta(hours=6 * i),
+                "created_at": start + timedelta(hours=6 * i, seconds=30)
+            }
+            for i in range(offset, min(offset + 50_000, usage_rows))
+        ])
+    db.execute(insert(models.CheckIn), [
+        {
+            "user_id": user.id,
+            "date": start + timedelta(days=i),
+            "transcript": "Patient reports feeling well. " * 40,
+            "side_effects": ["nausea"],
+            "red_flags": [],
+            "mood": 7,
+            "clinical_effectiveness": ["stable"],
+            "created_at": start + timedelta(days=i)
+        }
+        for i in range(check_ins)
+    ])
+    db.commit()
+    db.close()
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--usage-rows", type=int, default=2_000_000)
+    parser.add_argument("--check-ins", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+
+        # Populate in a child process so its memory does not mask the export's peak RSS
+        began = time.perf_counter()
+        child = multiprocessing.Process(target=populate, args=(url, args.usage_rows, args.check_ins))
+        child.start()
+        child.join()
+        print(f"Inserted {args.usage_rows} usage rows in {time.perf_counter() - began:.1f}s")
+
+        db = sessionmaker(autocommit=False, autoflush=False, bind=create_engine(url))()
+        user_id = db.query(models.User.id).scalar()
+
+        records = args.usage_rows + args.check_ins + 2
+        baseline_rss = peak_rss_mb()
+        for export_format, compress in [("ndjson", False), ("ndjson", True), ("csv", False), ("csv", True)]:
+            size = 0
+            began = time.perf_counter()
+            for chunk in stream_user_export(db, user_id, export_format, compress, args.batch_size):
+                size += len(chunk)
+            elapsed = time.perf_counter() - began
+            label = export_format + (".gz" if compress else "")
+            print(f"{label:10} {records / elapsed:>10,.0f} rows/s  {size / 1e6:8.1f} MB  "
+                  f"{elapsed:6.1f}s  peak RSS +{peak_rss_mb() - baseline_rss:.1f} MB")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
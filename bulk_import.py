@@ -0,0 +1,388 @@
+"""
+Chunked bulk import of patient records.
+
+Input is JSONL with one record per line, in the same shape as the NDJSON
+produced by user_export.py:
+
+    {"record_type": "user", "id": 7, "email": "a@example.com", "full_name": "A"}
+    {"record_type": "prescription", "id": 3, "user_id": 7, "medication_name": ...}
+    {"record_type": "usage", "user_id": 7, "prescription_id": 3, "taken_at": ...}
+    {"record_type": "check_in", "user_id": 7, "transcript": ..., "mood": 6, ...}
+
+`id`, `user_id` and `prescription_id` are ids from the source system; parents
+must appear before the records that reference them. Lines are processed in
+chunks, each inserted with set-based statements in a single transaction
+together with its checkpoint and source-to-target id mappings, so re-running
+the same job resumes exactly where the last committed chunk ended. A job is
+tied to the size and hash of its input; re-running it with a different file
+is refused rather than resumed at the old offset.
+
+    python bulk_import.py clinic.jsonl --job clinic-a --on-conflict merge
+"""
+import argparse
+import hashlib
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 5000
+CONFLICT_POLICIES = ("skip", "merge")
+# Only the first few rejected lines are kept for the report
+MAX_REJECTED_EXAMPLES = 100
+_HASH_BLOCK_SIZE = 1 << 20
+
+RECORD_TYPES = ("user", "prescription", "usage", "check_in")
+
+_SCHEMAS = {
+    "user": schemas.UserCreate,
+    "prescription": schemas.PrescriptionCreate,
+    "usage": schemas.UsageCreate,
+    "check_in": schemas.CheckInCreate,
+}
+
+
+class ImportReport:
+    def __init__(
+        self,
+        job: str,
+        lines: int,
+        inserted: Dict[str, int],
+        skipped: Dict[str, int],
+        rejected: int,
+        rejected_examples: List[Dict[str, Any]],
+        elapsed_seconds: float,
+        rows_per_second: float
+    ):
+        self.job = job
+        self.lines = lines
+        self.inserted = inserted
+        self.skipped = skipped
+        self.rejected = rejected
+        self.rejected_examples = rejected_examples
+        self.elapsed_seconds = elapsed_seconds
+        self.rows_per_second = rows_per_second
+
+
+class CheckpointMismatchError(ValueError):
+    """The job's checkpoint belongs to a different input file."""
+
+
+class _Chunk:
+    """Parsed and validated records of one chunk, grouped by record type."""
+
+    def __init__(self):
+        self.records: Dict[str, List[Tuple[int, Dict[str, Any], Any]]] = {
+            record_type: [] for record_type in RECORD_TYPES
+        }
+        self.rejected: List[Tuple[int, str]] = []
+        self.size = 0
+
+    def add(self, line_number: int, line: bytes) -> None:
+        self.size += 1
+        try:
+            raw = json.loads(line)
+            record_type = raw.get("record_type")
+            if record_type not in _SCHEMAS:
+                raise ValueError(f"Unknown record_type: {record_type!r}")
+            record = _SCHEMAS[record_type].model_validate(raw)
+            if record_type != "user" and not isinstance(raw.get("user_id"), int):
+                raise ValueError("user_id is required")
+            _parse_created_at(raw)
+        except (ValueError, ValidationError, AttributeError) as e:
+            self.rejected.append((line_number, str(e)))
+            return
+        self.records[record_type].append((line_number, raw, record))
+
+    def __len__(self) -> int:
+        return self.size
+
+
+def _parse_created_at(raw: Dict[str, Any]) -> None:
+    # Keep the source system's created_at when it is provided; parsed while
+    # validating so a bad value rejects its line instead of the whole chunk
+    value = raw.get("created_at")
+    if isinstance(value, str):
+        raw["created_at"] = datetime.fromisoformat(value)
+
+
+def _created_at(raw: Dict[str, Any]) -> Dict[str, Any]:
+    value = raw.get("created_at")
+    return {"created_at": value} if isinstance(value, datetime) else {}
+
+
+def _fingerprint(source: BinaryIO) -> Tuple[int, str]:
+    source.seek(0)
+    digest = hashlib.sha256()
+    size = 0
+    for block in iter(lambda: source.read(_HASH_BLOCK_SIZE), b""):
+        digest.update(block)
+        size += len(block)
+    return size, digest.hexdigest()
+
+
+class _Importer:
+    def __init__(self, db: Session, job: str, on_conflict: str, fingerprint: Tuple[int, str]):
+        self.db = db
+        self.job = job
+        self.on_conflict = on_conflict
+        self.id_maps: Dict[str, Dict[int, Optional[int]]] = {"user": {}, "prescription": {}}
+
+        for record_type, source_id, target_id in db.execute(
+            select(models.ImportIdMap.record_type, models.ImportIdMap.source_id, models.ImportIdMap.target_id)
+            .where(models.ImportIdMap.job == job)
+        ):
+            self.id_maps[record_type][source_id] = target_id
+
+        source_size, source_sha256 = fingerprint
+        checkpoint = db.get(models.ImportCheckpoint, job)
+        if checkpoint is None:
+            checkpoint = models.ImportCheckpoint(
+                job=job, source_size=source_size, source_sha256=source_sha256, offset=0, lines=0,
+                counts={"inserted": {}, "skipped": {}, "rejected": 0}
+            )
+            db.add(checkpoint)
+        elif (checkpoint.source_size, checkpoint.source_sha256) != (source_size, source_sha256):
+            raise CheckpointMismatchError(
+                f"Import job {job!r} was started with a different input file; use a new job name"
+            )
+        self.checkpoint = checkpoint
+
+    def _resolve(self, record_type: str, source_id: Any) -> Tuple[Optional[int], Optional[str]]:
+        """Map a source id to (target id, None), or (None, "skipped"/"rejected")."""
+        id_map = self.id_maps[record_type]
+        if source_id not in id_map:
+            return None, "rejected"
+        target_id = id_map[source_id]
+        return (target_id, None) if target_id is not None else (None, "skipped")
+
+    def _insert(self, model, rows: List[Dict[str, Any]]) -> List[int]:
+        if not rows:
+            return []
+        result = self.db.execute(insert(model).returning(model.id, sort_by_parameter_order=True), rows)
+        return list(result.scalars())
+
+    def _import_users(self, chunk: _Chunk, counts: Dict[str, Any], id_rows: List[Dict[str, Any]]) -> None:
+        users = chunk.records["user"]
+        emails = {record.email for _, _, record in users}
+        existing = dict(self.db.execute(
+            select(models.User.email, models.User.id).where(models.User.email.in_(emails))
+        ).all()) if emails else {}
+
+        rows = []
+        new_sources = []
+        duplicates = []
+        pending_emails = {}
+        for line_number, raw, record in users:
+            source_id = raw.get("id")
+            if record.email in existing:
+                target_id = existing[record.email] if self.on_conflict == "merge" else None
+                counts["skipped"]["user"] = counts["skipped"].get("user", 0) + 1
+                self._map_user(source_id, target_id, id_rows)
+            elif record.email in pending_emails:
+                # Duplicate email within the same chunk resolves to the first occurrence
+                counts["skipped"]["user"] = counts["skipped"].get("user", 0) + 1
+                duplicates.append((source_id, pending_emails[record.email]))
+            else:
+                pending_emails[record.email] = len(rows)
+                rows.append({"email": record.email, "full_name": record.full_name, **_created_at(raw)})
+                new_sources.append(source_id)
+
+        target_ids = self._insert(models.User, rows)
+        for source_id, target_id in zip(new_sources, target_ids):
+            self._map_user(source_id, target_id, id_rows)
+        for source_id, index in duplicates:
+            self._map_user(source_id, target_ids[index] if self.on_conflict == "merge" else None, id_rows)
+        counts["inserted"]["user"] = counts["inserted"].get("user", 0) + len(rows)
+
+    def _map_user(self, source_id: Any, target_id: Optional[int], id_rows: List[Dict[str, Any]]) -> None:
+        if isinstance(source_id, int) and source_id not in self.id_maps["user"]:
+            self.id_maps["user"][source_id] = target_id
+            id_rows.append({"job": self.job, "record_type": "user", "source_id": source_id, "target_id": target_id})
+
+    def _children(
+        self,
+        chunk: _Chunk,
+        record_type: str,
+        counts: Dict[str, Any],
+        build: Callable[[Dict[str, Any], Any, int], Tuple[Optional[Dict[str, Any]], Optional[str]]]
+    ) -> Tuple[List[Dict[str, Any]], List[Any]]:
+        rows = []
+        sources = []
+        for line_number, raw, record in chunk.records[record_type]:
+            user_id, problem = self._resolve("user", raw["user_id"])
+            row = None
+            if problem is None:
+                row, problem = build(raw, record, user_id)
+            if problem == "rejected":
+                chunk.rejected.append((line_number, f"Unknown parent for {record_type}"))
+            elif problem == "skipped":
+                counts["skipped"][record_type] = counts["skipped"].get(record_type, 0) + 1
+                if record_type == "prescription" and isinstance(raw.get("id"), int):
+                    sources.append((raw["id"], None))
+            else:
+                rows.append(row)
+                sources.append((raw.get("id"), len(rows) - 1))
+        return rows, sources
+
+    def import_chunk(self, chunk: _Chunk, offset: int, lines: int) -> None:
+        counts = self.checkpoint.counts
+        counts = {"inserted": dict(counts["inserted"]), "skipped": dict(counts["skipped"]), "rejected": counts["rejected"]}
+        id_rows: List[Dict[str, Any]] = []
+
+        self._import_users(chunk, counts, id_rows)
+
+        def prescription_row(raw, record, user_id):
+            return {"user_id": user_id, **record.model_dump(), **_created_at(raw)}, None
+
+        rows, sources = self._children(chunk, "prescription", counts, prescription_row)
+        target_ids = self._insert(models.Prescription, rows)
+        for source_id, index in sources:
+            target_id = target_ids[index] if index is not None else None
+            if isinstance(source_id, int) and source_id not in self.id_maps["prescription"]:
+                self.id_maps["prescription"][source_id] = target_id
+                id_rows.append({
+                    "job": self.job, "record_type": "prescription",
+                    "source_id": source_id, "target_id": target_id
+                })
+        counts["inserted"]["prescription"] = counts["inserted"].get("prescription", 0) + len(rows)
+
+        def usage_row(raw, record, user_id):
+            prescription_id, problem = self._resolve("prescription", record.prescription_id)
+            if problem:
+                return None, problem
+            return {"user_id": user_id, "prescription_id": prescription_id,
+                    "taken_at": record.taken_at, **_created_at(raw)}, None
+
+        def check_in_row(raw, record, user_id):
+            row = {"user_id": user_id, **record.model_dump(), **_created_at(raw)}
+            row["date"] = row["date"] or datetime.now(timezone.utc)
+            return row, None
+
+        for record_type, model, build in (
+            ("usage", models.Usage, usage_row),
+            ("check_in", models.CheckIn, check_in_row),
+        ):
+            rows, _ = self._children(chunk, record_type, counts, build)
+            if rows:
+                self.db.execute(insert(model), rows)
+            counts["inserted"][record_type] = counts["inserted"].get(record_type, 0) + len(rows)
+
+        if id_rows:
+            self.db.execute(insert(models.ImportIdMap), id_rows)
+
+        counts["rejected"] += len(chunk.rejected)
+        self.checkpoint.counts = counts
+        self.checkpoint.offset = offset
+        self.checkpoint.lines = lines
+        self.db.commit()
+
+
+def import_jsonl(
+    db: Session,
+    source: BinaryIO,
+    job: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    on_conflict: str = "skip",
+    progress: Optional[Callable[[int, float], None]] = None
+) -> ImportReport:
+    """
+    Import JSONL records from a seekable binary stream in transactional chunks.
+
+    A user whose email is already registered is skipped together with
+    everything that references it (`on_conflict="skip"`), or its records are
+    attached to the existing user (`on_conflict="merge"`). Invalid lines and
+    records with unknown parents are rejected and reported, not fatal.
+    Raises CheckpointMismatchError if `job` was started with a different input.
+
+    `progress` is called after each committed chunk with the number of lines
+    processed so far and the current rows/sec.
+    """
+    if on_conflict not in CONFLICT_POLICIES:
+        raise ValueError(f"Unsupported conflict policy: {on_conflict}")
+
+    importer = _Importer(db, job, on_conflict, _fingerprint(source))
+    offset = importer.checkpoint.offset or 0
+    lines = importer.checkpoint.lines or 0
+    source.seek(offset)
+    if offset:
+        logger.info(f"Resuming import job {job} at line {lines + 1}")
+
+    started = time.perf_counter()
+    processed = 0
+    rejected_examples: List[Dict[str, Any]] = []
+
+    def flush(chunk: _Chunk) -> None:
+        nonlocal processed
+        try:
+            importer.import_chunk(chunk, offset, lines)
+        except Exception:
+            db.rollback()
+            raise
+        for line_number, error in chunk.rejected:
+            if len(rejected_examples) < MAX_REJECTED_EXAMPLES:
+                rejected_examples.append({"line": line_number, "error": error})
+        processed += len(chunk)
+        rate = processed / max(time.perf_counter() - started, 1e-9)
+        logger.info(f"Import job {job}: {lines} lines committed ({rate:,.0f} rows/s)")
+        if progress:
+            progress(lines, rate)
+
+    chunk = _Chunk()
+    for line in iter(source.readline, b""):
+        offset += len(line)
+        lines += 1
+        if line.strip():
+            chunk.add(lines, line)
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = _Chunk()
+    if len(chunk) or offset != importer.checkpoint.offset:
+        flush(chunk)
+
+    elapsed = time.perf_counter() - started
+    counts = importer.checkpoint.counts
+    return ImportReport(
+        job=job,
+        lines=lines,
+        inserted=counts["inserted"],
+        skipped=counts["skipped"],
+        rejected=counts["rejected"],
+        rejected_examples=rejected_examples,
+        elapsed_seconds=elapsed,
+        rows_per_second=processed / elapsed if elapsed else 0.0
+    )
+
+
+if __name__ == "__main__":
+    from database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Bulk import users, prescriptions, usage and check-ins")
+    parser.add_argument("path", help="JSONL input file")
+    parser.add_argument("--job", help="Job name used for resumable checkpoints (default: the input path)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--on-conflict", choices=CONFLICT_POLICIES, default="skip")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    models.Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        with open(args.path, "rb") as source:
+            report = import_jsonl(db, source, args.job or args.path, args.chunk_size, args.on_conflict)
+    except CheckpointMismatchError as e:
+        parser.error(str(e))
+    finally:
+        db.close()
+    print(json.dumps(vars(report), indent=2))
@@ -0,0 +1,184 @@
+"""
+Incremental check-in transcripts streamed from realtime voice sessions.
+
+A stream owns a draft CheckIn (marked by a row in `check_in_drafts`) and
+buffers transcript chunks in memory, appending them to the stored transcript
+in one UPDATE once enough text or time has accumulated. Every chunk carries a
+sequence number and the last persisted one is stored with the draft, so a
+client that reconnects can resume by re-sending everything after it. Writes
+only apply while the stored sequence number is the one the stream last saw,
+so a stale connection for the same draft never appends chunks twice.
+"""
+import os
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+
+FLUSH_CHARS = int(os.getenv("CHECK_IN_FLUSH_CHARS", "4096"))
+FLUSH_SECONDS = float(os.getenv("CHECK_IN_FLUSH_SECONDS", "2"))
+
+
+class TranscriptStream:
+    def __init__(self, db: Session, user_id: int, check_in_id: int, last_seq: int):
+        self.db = db
+        self.user_id = user_id
+        self.check_in_id = check_in_id
+        # Highest sequence number persisted, and highest accepted (possibly still buffered)
+        self.persisted_seq = last_seq
+        self.received_seq = last_seq
+        self.metadata: Optional[schemas.CheckInFinalize] = None
+        self._buffer: List[Tuple[int, str]] = []
+        self._buffered_chars = 0
+        self._last_flush = time.monotonic()
+
+    @classmethod
+    def open(cls, db: Session, user_id: int, check_in_id: Optional[int] = None) -> Optional["TranscriptStream"]:
+        """
+        Start a new draft check-in, or resume `check_in_id`.
+
+        Returns None when `check_in_id` is not an unfinished draft of this user.
+        """
+        if check_in_id is not None:
+            draft = db.execute(
+                select(models.CheckInDraft).where(
+                    models.CheckInDraft.check_in_id == check_in_id,
+                    models.CheckInDraft.user_id == user_id
+                )
+            ).scalar_one_or_none()
+            last_seq = None if draft is None else draft.last_seq
+            # End the read so an idle stream does not hold a pooled connection
+            db.rollback()
+            if last_seq is None:
+                return None
+            return cls(db, user_id, check_in_id, last_seq)
+
+        db_check_in = models.CheckIn(
+            user_id=user_id,
+            transcript="",
+            side_effects=[],
+            red_flags=[],
+            clinical_effectiveness=[],
+            date=datetime.now(timezone.utc)
+        )
+        db.add(db_check_in)
+        db.flush()
+        # Read before committing: refreshing the expired id would begin a new transaction
+        check_in_id = db_check_in.id
+        db.add(models.CheckInDraft(check_in_id=check_in_id, user_id=user_id, last_seq=0))
+        db.commit()
+        return cls(db, user_id, check_in_id, 0)
+
+    def add(self, text: str, seq: Optional[int] = None) -> bool:
+        """Buffer a chunk; chunks already received (e.g. re-sent after a resume) are ignored."""
+        if seq is not None and (not isinstance(seq, int) or isinstance(seq, bool) or seq < 1):
+            raise ValueError(f"seq must be a positive integer, got {seq!r}")
+        seq = self.received_seq + 1 if seq is None else seq
+        if seq <= self.received_seq:
+            return False
+        self.received_seq = seq
+        self._buffer.append((seq, text))
+        self._buffered_chars += len(text)
+        return True
+
+    @property
+    def pending(self) -> bool:
+        return self.received_seq > self.persisted_seq
+
+    def should_flush(self) -> bool:
+        return self.pending and (
+            self._buffered_chars >= FLUSH_CHARS
+            or time.monotonic() - self._last_flush >= FLUSH_SECONDS
+        )
+
+    def seconds_until_flush(self) -> Optional[float]:
+        if not self.pending:
+            return None
+        return max(FLUSH_SECONDS - (time.monotonic() - self._last_flush), 0.0)
+
+    def flush(self) -> bool:
+        """
+        Append buffered text to the stored transcript in a single transaction.
+
+        If another stream for the same draft (usually a resumed connection
+        while this one was still open) wrote in the meantime, chunks it already
+        stored are dropped from the buffer and the rest are retried. Returns
+        False once the draft no longer exists, e.g. after the other stream
+        finalized it.
+        """
+        while self.pending:
+            # Claim the sequence range first; holding the write lock makes the check and append atomic
+            claimed = self.db.execute(
+                update(models.CheckInDraft)
+                .where(
+                    models.CheckInDraft.check_in_id == self.check_in_id,
+                    models.CheckInDraft.last_seq == self.persisted_seq
+                )
+                .values(last_seq=self.received_seq)
+            ).rowcount
+            if claimed:
+                text = "".join(chunk for _, chunk in self._buffer)
+                # Append in SQL so the growing transcript is never read back into Python
+                self.db.execute(
+                    update(models.CheckIn)
+                    .where(models.CheckIn.id == self.check_in_id)
+                    .values(transcript=models.CheckIn.transcript + text)
+                )
+                self.db.commit()
+                self.persisted_seq = self.received_seq
+                self._set_buffer([])
+                self._last_flush = time.monotonic()
+                break
+
+            stored_seq = self.db.execute(
+                select(models.CheckInDraft.last_seq).where(models.CheckInDraft.check_in_id == self.check_in_id)
+            ).scalar_one_or_none()
+            self.db.rollback()
+            if stored_seq is None:
+                self.persisted_seq = self.received_seq
+                self._set_buffer([])
+                return False
+            self.persisted_seq = stored_seq
+            self.received_seq = max(self.received_seq, stored_seq)
+            self._set_buffer([(seq, chunk) for seq, chunk in self._buffer if seq > stored_seq])
+        return True
+
+    def _set_buffer(self, buffer: List[Tuple[int, str]]) -> None:
+        self._buffer = buffer
+        self._buffered_chars = sum(len(chunk) for _, chunk in buffer)
+
+    def finalize(self, metadata: Optional[schemas.CheckInFinalize] = None) -> Optional[models.CheckIn]:
+        """
+        Flush, store the check-in's analysis and turn the draft into a regular check-in.
+
+        Returns None if the draft was already finalized by another stream.
+        """
+        metadata = metadata or self.metadata
+        if not self.flush():
+            return None
+        values = {
+            "side_effects": metadata.side_effects,
+            "red_flags": metadata.red_flags,
+            "mood": metadata.mood,
+            "clinical_effectiveness": metadata.clinical_effectiveness,
+        }
+        if metadata.date is not None:
+            values["date"] = metadata.date
+        deleted = self.db.execute(
+            delete(models.CheckInDraft).where(models.CheckInDraft.check_in_id == self.check_in_id)
+        ).rowcount
+        if not deleted:
+            self.db.rollback()
+            return None
+        self.db.execute(update(models.CheckIn).where(models.CheckIn.id == self.check_in_id).values(**values))
+        self.db.commit()
+        db_check_in = self.db.get(models.CheckIn, self.check_in_id)
+        # Detach the loaded row and end the read before the caller awaits on the socket
+        self.db.expunge(db_check_in)
+        self.db.rollback()
+        return db_check_in
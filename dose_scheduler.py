@@ -0,0 +1,377 @@
+"""
+In-process scheduler of upcoming dose reminders.
+
+Every active prescription has exactly one entry in a min-heap keyed by the
+time its next dose is due. A tick pops the entries that have come due, hands
+a DoseReminder to the configured sink and pushes the prescription's following
+dose, so a tick costs O(k log n) for k due doses and O(1) when nothing is due.
+
+Prescription and usage writes update the heap incrementally. Rather than
+searching the heap, an update pushes a fresh entry tagged with a new sequence
+number; entries whose sequence no longer matches the prescription's schedule
+are discarded when popped.
+
+Dose times come from `prescription_metadata["dose_times"]` ("HH:MM" strings)
+when present, otherwise `times_per_day` doses are spread evenly between
+DAY_START and DAY_END.
+"""
+import asyncio
+import heapq
+import logging
+import os
+import threading
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+import models
+
+logger = logging.getLogger(__name__)
+
+DAY_START = time(8, 0)
+DAY_END = time(20, 0)
+# A dose logged up to this long before it is due counts as taking it
+EARLY_WINDOW = timedelta(hours=2)
+TICK_SECONDS = float(os.getenv("DOSE_SCHEDULER_TICK_SECONDS", "30"))
+
+
+class DoseReminder:
+    def __init__(
+        self,
+        user_id: int,
+        prescription_id: int,
+        medication_name: str,
+        dosage: str,
+        due_at: datetime
+    ):
+        self.user_id = user_id
+        self.prescription_id = prescription_id
+        self.medication_name = medication_name
+        self.dosage = dosage
+        self.due_at = due_at
+
+
+class ReminderSink:
+    """Destination for due reminders; subclass and pass to DoseScheduler."""
+
+    def send(self, reminder: DoseReminder) -> None:
+        raise NotImplementedError
+
+
+class LoggingReminderSink(ReminderSink):
+    def send(self, reminder: DoseReminder) -> None:
+        logger.info(
+            f"Dose due for user {reminder.user_id}: {reminder.medication_name} "
+            f"{reminder.dosage} at {reminder.due_at}"
+        )
+
+
+def _naive(value: Optional[datetime]) -> Optional[datetime]:
+    # Schedules use naive local time, like the rest of the app
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def dose_times(times_per_day: Optional[int], metadata: Optional[Dict[str, Any]] = None) -> Tuple[time, ...]:
+    """Times of day at which a prescription's doses are due."""
+    configured = (metadata or {}).get("dose_times")
+    if configured:
+        try:
+            return _parse_times(tuple(configured))
+        except (TypeError, ValueError):
+            logger.warning(f"Ignoring invalid dose_times: {configured!r}")
+
+    return _spread(max(times_per_day or 1, 1))
+
+
+# Both helpers are cached so prescriptions with the same times share one tuple
+
+@lru_cache(maxsize=4096)
+def _parse_times(configured: Tuple[str, ...]) -> Tuple[time, ...]:
+    return tuple(sorted(time.fromisoformat(value) for value in configured))
+
+
+@lru_cache(maxsize=None)
+def _spread(count: int) -> Tuple[time, ...]:
+    if count == 1:
+        return (DAY_START,)
+    start = DAY_START.hour * 60 + DAY_START.minute
+    step = (DAY_END.hour * 60 + DAY_END.minute - start) / (count - 1)
+    return tuple(
+        time(*divmod(int(start + step * index), 60))
+        for index in range(count)
+    )
+
+
+_PRESCRIPTION_FIELDS = (
+    "id", "user_id", "medication_name", "dosage", "times_per_day",
+    "start_date", "end_date", "prescription_metadata"
+)
+
+
+class _Schedule:
+    __slots__ = (
+        "user_id", "medication_name", "dosage", "times",
+        "start_date", "end_date", "next_due", "sequence"
+    )
+
+    def __init__(self, prescription):
+        self.user_id = prescription.user_id
+        self.medication_name = prescription.medication_name
+        self.dosage = prescription.dosage
+        self.times = dose_times(prescription.times_per_day, prescription.prescription_metadata)
+        self.start_date = _naive(prescription.start_date)
+        self.end_date = _naive(prescription.end_date)
+        self.next_due: Optional[datetime] = None
+        self.sequence = 0
+
+    def due_after(self, after: datetime) -> Optional[datetime]:
+        """First dose strictly after `after`, or None once the prescription has ended."""
+        if self.start_date is not None and after < self.start_date:
+            after = self.start_date - timedelta(microseconds=1)
+        day = after.date()
+        while True:
+            for dose_time in self.times:
+                due = datetime.combine(day, dose_time)
+                if due <= after:
+                    continue
+                if self.end_date is not None and due > self.end_date:
+                    return None
+                return due
+            day += timedelta(days=1)
+
+
+class DoseScheduler:
+    def __init__(self, sink: Optional[ReminderSink] = None, early_window: timedelta = EARLY_WINDOW):
+        self.sink = sink or LoggingReminderSink()
+        self.early_window = early_window
+        self._heap: List[Tuple[float, int, int]] = []
+        self._schedules: Dict[int, _Schedule] = {}
+        self._by_user: Dict[int, Set[int]] = {}
+        self._sequence = 0
+        self._lock = threading.Lock()
+        # Serialises reloads; while one builds new state, updates are journaled to replay after the swap
+        self._load_lock = threading.Lock()
+        self._pending: Optional[List[Tuple[Callable[..., Any], Tuple[Any, ...]]]] = None
+
+    def __len__(self) -> int:
+        return len(self._schedules)
+
+    def _entry(self, prescription_id: int, schedule: _Schedule) -> Tuple[float, int, int]:
+        self._sequence += 1
+        schedule.sequence = self._sequence
+        return (schedule.next_due.timestamp(), prescription_id, self._sequence)
+
+    def _push(self, prescription_id: int, schedule: _Schedule) -> None:
+        heapq.heappush(self._heap, self._entry(prescription_id, schedule))
+
+    def _add(self, prescription, now: datetime) -> Optional[_Schedule]:
+        schedule = _Schedule(prescription)
+        schedule.next_due = schedule.due_after(now)
+        if schedule.next_due is None:
+            return None
+        self._schedules[prescription.id] = schedule
+        self._by_user.setdefault(schedule.user_id, set()).add(prescription.id)
+        return schedule
+
+    def _discard(self, prescription_id: int) -> None:
+        # The heap entry is left behind and skipped when popped
+        schedule = self._schedules.pop(prescription_id, None)
+        if schedule is not None:
+            prescriptions = self._by_user.get(schedule.user_id)
+            if prescriptions is not None:
+                prescriptions.discard(prescription_id)
+                if not prescriptions:
+                    del self._by_user[schedule.user_id]
+
+    def _apply_usage(self, schedule: _Schedule, taken_at: datetime) -> bool:
+        # Only a dose logged between the early window and the following dose covers the upcoming one
+        if schedule.next_due is None or taken_at < schedule.next_due - self.early_window:
+            return False
+        following = schedule.due_after(schedule.next_due)
+        if following is not None and taken_at >= following:
+            return False
+        schedule.next_due = following
+        return True
+
+    def _apply(self, operation: Callable[..., Any], *args: Any) -> None:
+        # Called with the lock held
+        operation(*args)
+        if self._pending is not None:
+            self._pending.append((operation, args))
+
+    def _build(self, prescriptions: Iterable[Any], last_taken: Dict[int, datetime], now: datetime) -> None:
+        for prescription in prescriptions:
+            schedule = self._add(prescription, now)
+            if schedule is None:
+                continue
+            if prescription.id in last_taken:
+                self._apply_usage(schedule, _naive(last_taken[prescription.id]))
+            if schedule.next_due is None:
+                self._discard(prescription.id)
+            else:
+                self._heap.append(self._entry(prescription.id, schedule))
+        heapq.heapify(self._heap)
+
+    def load_prescriptions(
+        self,
+        prescriptions: Iterable[Any],
+        last_taken: Optional[Dict[int, datetime]] = None,
+        now: Optional[datetime] = None
+    ) -> None:
+        """
+        Replace all schedules, building the heap in O(n).
+
+        The new state is built without holding the lock, since `prescriptions`
+        may be a database cursor taking seconds to read, and swapped in at the
+        end. Updates made meanwhile are applied to both states.
+        """
+        now = now or datetime.now()
+        last_taken = last_taken or {}
+        with self._load_lock:
+            with self._lock:
+                self._pending = []
+            try:
+                builder = DoseScheduler(sink=self.sink, early_window=self.early_window)
+                builder._build(prescriptions, last_taken, now)
+            except BaseException:
+                with self._lock:
+                    self._pending = None
+                raise
+            with self._lock:
+                self._heap, self._schedules, self._by_user = builder._heap, builder._schedules, builder._by_user
+                self._sequence = max(self._sequence, builder._sequence)
+                pending, self._pending = self._pending, None
+                for operation, args in pending:
+                    operation(*args)
+        logger.info(f"Dose scheduler loaded {len(self._schedules)} active prescriptions")
+
+    def load(self, db: Session, now: Optional[datetime] = None, batch_size: int = 10000) -> None:
+        """Load every active prescription and its most recent dose from the database."""
+        now = now or datetime.now()
+        active = or_(models.Prescription.end_date.is_(None), models.Prescription.end_date >= now)
+
+        last_taken = dict(db.execute(
+            select(models.Usage.prescription_id, func.max(models.Usage.taken_at))
+            .join(models.Prescription, models.Prescription.id == models.Usage.prescription_id)
+            .where(active)
+            .group_by(models.Usage.prescription_id)
+        ).all())
+
+        prescriptions = db.execute(
+            select(
+                models.Prescription.id, models.Prescription.user_id, models.Prescription.medication_name,
+                models.Prescription.dosage, models.Prescription.times_per_day, models.Prescription.start_date,
+                models.Prescription.end_date, models.Prescription.prescription_metadata
+            ).where(active).execution_options(yield_per=batch_size)
+        )
+        self.load_prescriptions(prescriptions, last_taken, now)
+
+    def _upsert(self, prescription, now: datetime) -> None:
+        self._discard(prescription.id)
+        schedule = self._add(prescription, now)
+        if schedule is not None:
+            self._push(prescription.id, schedule)
+
+    def _remove_user(self, user_id: int) -> None:
+        for prescription_id in list(self._by_user.get(user_id, ())):
+            self._discard(prescription_id)
+
+    def _record_usage(self, prescription_id: int, taken_at: datetime) -> None:
+        schedule = self._schedules.get(prescription_id)
+        if schedule is not None and self._apply_usage(schedule, taken_at):
+            if schedule.next_due is None:
+                self._discard(prescription_id)
+            else:
+                self._push(prescription_id, schedule)
+
+    def upsert_prescription(self, prescription, now: Optional[datetime] = None) -> None:
+        now = now or datetime.now()
+        # Copy the fields so a replay after a reload never touches an expired ORM instance
+        prescription = SimpleNamespace(**{field: getattr(prescription, field) for field in _PRESCRIPTION_FIELDS})
+        with self._lock:
+            self._apply(self._upsert, prescription, now)
+
+    def remove_prescription(self, prescription_id: int) -> None:
+        with self._lock:
+            self._apply(self._discard, prescription_id)
+
+    def remove_user(self, user_id: int) -> None:
+        with self._lock:
+            self._apply(self._remove_user, user_id)
+
+    def record_usage(self, prescription_id: int, taken_at: datetime) -> None:
+        """Mark the upcoming dose as taken when it is logged within the early window."""
+        with self._lock:
+            self._apply(self._record_usage, prescription_id, _naive(taken_at))
+
+    def tick(self, now: Optional[datetime] = None) -> int:
+        """Send a reminder for every dose due at or before `now`. Returns the number sent."""
+        now_ts = (now or datetime.now()).timestamp()
+        reminders = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now_ts:
+                _, prescription_id, sequence = heapq.heappop(self._heap)
+                schedule = self._schedules.get(prescription_id)
+                if schedule is None or schedule.sequence != sequence:
+                    continue
+                reminders.append(DoseReminder(
+                    user_id=schedule.user_id,
+                    prescription_id=prescription_id,
+                    medication_name=schedule.medication_name,
+                    dosage=schedule.dosage,
+                    due_at=schedule.next_due
+                ))
+                schedule.next_due = schedule.due_after(schedule.next_due)
+                if schedule.next_due is None:
+                    self._discard(prescription_id)
+                else:
+                    self._push(prescription_id, schedule)
+
+        # Sinks may block or fail; neither should hold the lock or stop the tick
+        for reminder in reminders:
+            try:
+                self.sink.send(reminder)
+            except Exception as e:
+                logger.error(f"Error sending reminder for prescription {reminder.prescription_id}: {str(e)}")
+        return len(reminders)
+
+    def next_doses(self, user_id: int, limit: int = 5) -> List[DoseReminder]:
+        """The user's next `limit` doses across all active prescriptions, soonest first."""
+        upcoming = []
+        with self._lock:
+            for prescription_id in self._by_user.get(user_id, ()):
+                schedule = self._schedules[prescription_id]
+                due = schedule.next_due
+                for _ in range(limit):
+                    if due is None:
+                        break
+                    upcoming.append(DoseReminder(
+                        user_id=user_id,
+                        prescription_id=prescription_id,
+                        medication_name=schedule.medication_name,
+                        dosage=schedule.dosage,
+                        due_at=due
+                    ))
+                    due = schedule.due_after(due)
+        return heapq.nsmallest(limit, upcoming, key=lambda reminder: (reminder.due_at, reminder.prescription_id))
+
+
+async def run_scheduler(dose_scheduler: "DoseScheduler", interval: float = TICK_SECONDS) -> None:
+    """Tick forever; meant to run as a background task for the app's lifetime."""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, dose_scheduler.tick)
+        except Exception as e:
+            logger.error(f"Error in dose scheduler tick: {str(e)}")
+        await asyncio.sleep(interval)
+
+
+# Shared instance used by the routes and started with the app
+scheduler = DoseScheduler()
@@ -1,10 +1,13 @@
 from fastapi import FastAPI
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 import models
-from database import engine
-from routes import users, prescriptions, check_ins, llm
+from database import SessionLocal, engine
+from dose_scheduler import run_scheduler, scheduler
+from routes import users, prescriptions, check_ins, llm, usage, export, bulk_import, reminders
 
 # Load environment variables from .env file
 load_dotenv()
@@ -16,13 +19,29 @@ logger = logging.getLogger(__name__)
 # Create the database tables
 models.Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Prescription Management API", debug=True)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the dose reminder heap once, then keep it ticking in the background
+    db = SessionLocal()
+    try:
+        scheduler.load(db)
+    finally:
+        db.close()
+    scheduler_task = asyncio.create_task(run_scheduler(scheduler))
+    yield
+    scheduler_task.cancel()
+
+app = FastAPI(title="Prescription Management API", debug=True, lifespan=lifespan)
 
 
 # Include routers
 app.include_router(users.router)
 app.include_router(prescriptions.router)
 app.include_router(check_ins.router)
+app.include_router(usage.router)
+app.include_router(export.router)
+app.include_router(bulk_import.router)
+app.include_router(reminders.router)
 app.include_router(llm.router)
 
 if __name__ == "__main__":
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, JSON
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, JSON, LargeBinary, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime, timezone
@@ -37,6 +37,12 @@ class Prescription(Base):
 
 class Usage(Base):
     __tablename__ = "usage"
+    __table_args__ = (
+        # Serves per-user history reads in time order, such as export pages
+        Index("ix_usage_user_id_taken_at", "user_id", "taken_at", "id"),
+        # Archived rows keep their ids, so SQLite must never hand them out again
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -60,4 +66,46 @@ class CheckIn(Base):
     clinical_effectiveness = Column(JSON)  # List of strings
     created_at = Column(DateTime, default=datetime.now(timezone.utc))
     
-    user = relationship("User", back_populates="check_ins") 
\ No newline at end of file
+    user = relationship("User", back_populates="check_ins")
+
+class UsageArchive(Base):
+    __tablename__ = "usage_archive"
+    __table_args__ = (UniqueConstraint("user_id", "prescription_id", "month"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    prescription_id = Column(Integer, ForeignKey("prescriptions.id"), index=True)
+    month = Column(DateTime)               # First day of the archived month
+    slots_per_day = Column(Integer)        # Bitmap slots per day (times_per_day at compaction)
+    dose_count = Column(Integer)
+    taken_bitmap = Column(LargeBinary)     # Bit (day * slots_per_day + slot) set when that dose was taken
+    doses = Column(LargeBinary)            # Varint-packed ids and exact timestamps, see usage_archive.py
+    created_at = Column(DateTime, default=datetime.now(timezone.utc))
+
+class ImportCheckpoint(Base):
+    __tablename__ = "import_checkpoints"
+
+    job = Column(String, primary_key=True)
+    source_size = Column(Integer)          # Size and SHA-256 of the input the job was started with
+    source_sha256 = Column(String)
+    offset = Column(Integer, default=0)    # Byte offset of the next unread input line
+    lines = Column(Integer, default=0)
+    counts = Column(JSON)                  # Cumulative inserted/skipped/rejected counts
+    updated_at = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+
+class ImportIdMap(Base):
+    __tablename__ = "import_id_map"
+
+    job = Column(String, primary_key=True)
+    record_type = Column(String, primary_key=True)
+    source_id = Column(Integer, primary_key=True)
+    target_id = Column(Integer, nullable=True)  # NULL when the source record was skipped
+
+class CheckInDraft(Base):
+    __tablename__ = "check_in_drafts"
+
+    # Present while a streamed check-in is still being written; removed once finalized
+    check_in_id = Column(Integer, ForeignKey("check_ins.id"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    last_seq = Column(Integer, default=0)  # Sequence number of the last persisted transcript chunk
+    updated_at = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
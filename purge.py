@@ -0,0 +1,205 @@
+"""
+Set-based user purge, orphan sweeping and incremental space reclamation.
+
+Deleting a user through the ORM would load every dependent row into the
+session; the relationships on User and Prescription have no cascade, so a
+plain `db.delete` also leaves usage, check-ins and prescriptions behind. The
+functions here issue one DELETE per table instead, and reclaim the freed
+pages afterwards in small `incremental_vacuum` steps so writers are never
+blocked for long.
+
+    python purge.py --sweep-orphans --vacuum
+    python purge.py --enable-incremental-vacuum   # one-off full VACUUM
+"""
+import argparse
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import and_, delete, or_, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+import models
+
+logger = logging.getLogger(__name__)
+
+SWEEP_BATCH_SIZE = 10000
+VACUUM_PAGES_PER_STEP = 256
+VACUUM_PAUSE_SECONDS = 0.05
+
+# Only one vacuum runs at a time; further requests are dropped while it works
+_vacuum_lock = threading.Lock()
+
+
+def purge_user(db: Session, user_id: int) -> Optional[Dict[str, int]]:
+    """
+    Delete a user and everything that belongs to them in one transaction.
+
+    Returns the number of rows deleted per table, or None if the user does
+    not exist.
+    """
+    if db.execute(select(models.User.id).where(models.User.id == user_id)).first() is None:
+        return None
+
+    prescription_ids = select(models.Prescription.id).where(models.Prescription.user_id == user_id)
+    statements = [
+        ("usage", delete(models.Usage).where(or_(
+            models.Usage.user_id == user_id,
+            models.Usage.prescription_id.in_(prescription_ids)
+        ))),
+        ("usage_archive", delete(models.UsageArchive).where(or_(
+            models.UsageArchive.user_id == user_id,
+            models.UsageArchive.prescription_id.in_(prescription_ids)
+        ))),
+        ("check_in_drafts", delete(models.CheckInDraft).where(models.CheckInDraft.user_id == user_id)),
+        ("check_ins", delete(models.CheckIn).where(models.CheckIn.user_id == user_id)),
+        ("import_id_map", delete(models.ImportIdMap).where(or_(
+            and_(models.ImportIdMap.record_type == "user", models.ImportIdMap.target_id == user_id),
+            and_(models.ImportIdMap.record_type == "prescription", models.ImportIdMap.target_id.in_(prescription_ids))
+        ))),
+        ("prescriptions", delete(models.Prescription).where(models.Prescription.user_id == user_id)),
+        ("users", delete(models.User).where(models.User.id == user_id)),
+    ]
+
+    deleted = {}
+    try:
+        for table, statement in statements:
+            deleted[table] = db.execute(statement.execution_options(synchronize_session=False)).rowcount
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    logger.info(f"Purged user {user_id}: {deleted}")
+    return deleted
+
+
+def _sweep(db: Session, model, orphaned, batch_size: int) -> int:
+    # Delete in id batches so each transaction, and its write lock, stays short
+    total = 0
+    while True:
+        batch = select(model.id).where(orphaned).limit(batch_size)
+        deleted = db.execute(
+            delete(model).where(model.id.in_(batch)).execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        total += deleted
+        if deleted < batch_size:
+            return total
+
+
+def sweep_orphans(db: Session, batch_size: int = SWEEP_BATCH_SIZE) -> Dict[str, int]:
+    """Delete rows whose user or prescription no longer exists."""
+    user_ids = select(models.User.id)
+    prescription_ids = select(models.Prescription.id)
+
+    def missing(column, parent_ids):
+        return or_(column.is_(None), column.not_in(parent_ids))
+
+    # Prescriptions go first so usage orphaned by them is swept in the same run
+    swept = {
+        "prescriptions": _sweep(db, models.Prescription, missing(models.Prescription.user_id, user_ids), batch_size),
+        "usage": _sweep(db, models.Usage, or_(
+            missing(models.Usage.user_id, user_ids),
+            missing(models.Usage.prescription_id, prescription_ids)
+        ), batch_size),
+        "usage_archive": _sweep(db, models.UsageArchive, or_(
+            missing(models.UsageArchive.user_id, user_ids),
+            missing(models.UsageArchive.prescription_id, prescription_ids)
+        ), batch_size),
+        "check_ins": _sweep(db, models.CheckIn, missing(models.CheckIn.user_id, user_ids), batch_size),
+    }
+    # Drafts are keyed by check-in rather than id, so they are swept in one statement
+    swept["check_in_drafts"] = db.execute(
+        delete(models.CheckInDraft).where(
+            models.CheckInDraft.check_in_id.not_in(select(models.CheckIn.id))
+        ).execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    logger.info(f"Swept orphaned rows: {swept}")
+    return swept
+
+
+def enable_incremental_vacuum(engine: Engine) -> None:
+    """
+    Switch an existing database to auto_vacuum=INCREMENTAL.
+
+    This needs a full VACUUM, which rewrites the whole file and holds an
+    exclusive lock while it runs, so it is a one-off maintenance step.
+    """
+    with engine.connect() as connection:
+        connection.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        connection.exec_driver_sql("VACUUM")
+
+
+def incremental_vacuum(
+    engine: Engine,
+    pages_per_step: int = VACUUM_PAGES_PER_STEP,
+    pause_seconds: float = VACUUM_PAUSE_SECONDS
+) -> int:
+    """
+    Return free pages to the filesystem a few at a time.
+
+    Each step is its own short write transaction, with a pause in between
+    so request handlers can take the write lock. Does nothing unless the
+    database uses auto_vacuum=INCREMENTAL. Returns the number of pages freed.
+    """
+    if not _vacuum_lock.acquire(blocking=False):
+        return 0
+    try:
+        pooled = engine.raw_connection()
+        connection = pooled.driver_connection
+        try:
+            if connection.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                logger.info("Skipping incremental vacuum: auto_vacuum is not INCREMENTAL")
+                return 0
+
+            freed = 0
+            while True:
+                free_pages = connection.execute("PRAGMA freelist_count").fetchone()[0]
+                if free_pages == 0:
+                    break
+                # executescript steps the pragma to completion; execute would free a single page
+                connection.executescript(f"PRAGMA incremental_vacuum({pages_per_step});")
+                freed += min(free_pages, pages_per_step)
+                time.sleep(pause_seconds)
+        finally:
+            pooled.close()
+    finally:
+        _vacuum_lock.release()
+
+    logger.info(f"Incremental vacuum freed {freed} pages")
+    return freed
+
+
+if __name__ == "__main__":
+    from database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Purge users, sweep orphans and reclaim space")
+    parser.add_argument("--user", type=int, action="append", default=[], help="Purge this user (repeatable)")
+    parser.add_argument("--sweep-orphans", action="store_true", help="Delete rows whose user or prescription is gone")
+    parser.add_argument("--vacuum", action="store_true", help="Reclaim free pages incrementally")
+    parser.add_argument(
+        "--enable-incremental-vacuum", action="store_true",
+        help="Convert the database to auto_vacuum=INCREMENTAL (runs a full VACUUM)"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    models.Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        for user_id in args.user:
+            print(f"User {user_id}: {purge_user(db, user_id) or 'not found'}")
+        if args.sweep_orphans:
+            print(f"Orphans: {sweep_orphans(db)}")
+    finally:
+        db.close()
+
+    if args.enable_incremental_vacuum:
+        enable_incremental_vacuum(engine)
+    if args.vacuum:
+        print(f"Freed {incremental_vacuum(engine)} pages")
@@ -0,0 +1,40 @@
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from sqlalchemy.orm import Session
+from typing import Literal, Optional
+import logging
+
+import bulk_import
+import schemas
+from database import get_db
+from dose_scheduler import scheduler
+
+router = APIRouter(
+    prefix="/users",
+    tags=["import"]
+)
+
+logger = logging.getLogger(__name__)
+
+@router.post("/import", response_model=schemas.ImportReportResponse)
+def import_records(
+    file: UploadFile = File(...),
+    job: Optional[str] = None,
+    chunk_size: int = bulk_import.DEFAULT_CHUNK_SIZE,
+    on_conflict: Literal["skip", "merge"] = "skip",
+    db: Session = Depends(get_db)
+):
+    if chunk_size < 1:
+        raise HTTPException(status_code=400, detail="chunk_size must be positive")
+
+    # Re-posting the same file with the same job resumes from its last checkpoint
+    job = job or file.filename
+    logger.info(f"Starting bulk import job: {job}")
+    try:
+        report = bulk_import.import_jsonl(db, file.file, job, chunk_size, on_conflict)
+    except bulk_import.CheckpointMismatchError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    # Imports are rare and large, so rebuild the reminder heap rather than upserting row by row
+    if report.inserted.get("prescription") or report.inserted.get("usage"):
+        scheduler.load(db)
+    return report
@@ -1,11 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime, timezone
+import asyncio
+import json
 import logging
 
 import models
 import schemas
+from check_in_stream import TranscriptStream
 from database import get_db
 
 router = APIRouter(
@@ -55,8 +60,11 @@ def get_user_check_ins(
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Build query
-    query = db.query(models.CheckIn).filter(models.CheckIn.user_id == user_id)
+    # Build query, leaving out check-ins that are still being streamed
+    query = db.query(models.CheckIn).filter(
+        models.CheckIn.user_id == user_id,
+        models.CheckIn.id.not_in(db.query(models.CheckInDraft.check_in_id))
+    )
     
     # Apply date filters if provided
     if start_date:
@@ -83,10 +91,122 @@ def get_check_in(
     # Get check-in
     db_check_in = db.query(models.CheckIn).filter(
         models.CheckIn.id == check_in_id,
-        models.CheckIn.user_id == user_id
+        models.CheckIn.user_id == user_id,
+        models.CheckIn.id.not_in(db.query(models.CheckInDraft.check_in_id))
     ).first()
     
     if db_check_in is None:
         raise HTTPException(status_code=404, detail="Check-in not found")
     
-    return db_check_in 
\ No newline at end of file
+    return db_check_in
+
+def _open_stream(db: Session, user_id: int, check_in_id: Optional[int]):
+    # Check and open in one call that ends its transaction, so streams waiting on
+    # the event loop never hold a pooled connection
+    if db.get(models.User, user_id) is None:
+        db.rollback()
+        return None, "User not found"
+    stream = TranscriptStream.open(db, user_id, check_in_id)
+    return stream, None if stream is not None else "Check-in draft not found"
+
+@router.websocket("/stream")
+async def stream_check_in(
+    websocket: WebSocket,
+    user_id: int,
+    check_in_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Stream a check-in transcript as it is produced by a realtime voice session.
+
+    Client messages (JSON):
+        {"type": "chunk", "seq": 1, "text": "..."}   seq is optional but needed to resume
+        {"type": "metadata", "mood": 7, "side_effects": [...], ...}
+        {"type": "finalize", "mood": 7, ...}           metadata fields optional if already sent
+
+    The server replies {"type": "session", "check_in_id": ..., "last_seq": ...} on
+    connect and {"type": "finalized", "check_in": {...}} before closing. A normal
+    close also finalizes once metadata has been sent; any other disconnect keeps
+    the draft, which is resumed by reconnecting with ?check_in_id= and
+    re-sending chunks after last_seq. Malformed or unknown messages get a
+    {"type": "error"} reply. A stream whose draft was finalized by another
+    connection is closed with code 4409.
+    """
+    stream, error = await run_in_threadpool(_open_stream, db, user_id, check_in_id)
+    if stream is None:
+        await websocket.close(code=4404, reason=error)
+        return
+
+    await websocket.accept()
+    await websocket.send_json({"type": "session", "check_in_id": stream.check_in_id, "last_seq": stream.persisted_seq})
+
+    disconnect_code = None
+    try:
+        while True:
+            try:
+                frame = await asyncio.wait_for(websocket.receive(), timeout=stream.seconds_until_flush())
+            except asyncio.TimeoutError:
+                # Nothing arrived for a while; write out what is buffered
+                if not await run_in_threadpool(stream.flush):
+                    await _close_superseded(websocket)
+                    return
+                continue
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+
+            try:
+                message = json.loads(frame.get("text") or "")
+            except ValueError:
+                await websocket.send_json({"type": "error", "detail": "Expected a JSON text message"})
+                continue
+
+            message_type = message.get("type") if isinstance(message, dict) else None
+            if message_type == "chunk" and isinstance(message.get("text"), str):
+                seq = message.get("seq")
+                if seq is not None and (not isinstance(seq, int) or isinstance(seq, bool) or seq < 1):
+                    await websocket.send_json({"type": "error", "detail": "seq must be a positive integer"})
+                    continue
+                stream.add(message["text"], seq)
+                if stream.should_flush() and not await run_in_threadpool(stream.flush):
+                    await _close_superseded(websocket)
+                    return
+            elif message_type in ("metadata", "finalize"):
+                try:
+                    fields = {key: value for key, value in message.items() if key != "type"}
+                    if stream.metadata is not None:
+                        fields = {**stream.metadata.model_dump(exclude_unset=True), **fields}
+                    stream.metadata = schemas.CheckInFinalize.model_validate(fields)
+                except ValidationError as e:
+                    await websocket.send_json({"type": "error", "detail": e.errors(include_url=False)})
+                    continue
+                if message_type == "finalize":
+                    db_check_in = await run_in_threadpool(stream.finalize)
+                    if db_check_in is None:
+                        await _close_superseded(websocket)
+                        return
+                    logger.info(f"Finalized streamed check-in with ID: {db_check_in.id} for user: {user_id}")
+                    await websocket.send_json({
+                        "type": "finalized",
+                        "check_in": schemas.CheckInResponse.model_validate(db_check_in).model_dump(mode="json")
+                    })
+                    await websocket.close()
+                    return
+            else:
+                await websocket.send_json({"type": "error", "detail": "Unsupported message"})
+    except WebSocketDisconnect as e:
+        disconnect_code = e.code
+    finally:
+        # However the stream ended, keep what was received so the client can resume
+        if stream.pending:
+            await run_in_threadpool(stream.flush)
+
+    if disconnect_code == 1000 and stream.metadata is not None:
+        db_check_in = await run_in_threadpool(stream.finalize)
+        if db_check_in is not None:
+            logger.info(f"Finalized streamed check-in with ID: {db_check_in.id} for user: {user_id} on close")
+            return
+    logger.info(f"Check-in stream {stream.check_in_id} for user: {user_id} disconnected at seq {stream.persisted_seq}")
+
+async def _close_superseded(websocket: WebSocket):
+    await websocket.send_json({"type": "error", "detail": "Check-in was finalized by another stream"})
+    await websocket.close(code=4409)
@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from typing import Literal
+import logging
+
+import models
+import user_export
+from database import get_db
+
+router = APIRouter(
+    prefix="/users/{user_id}",
+    tags=["export"]
+)
+
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+@router.get("/export")
+def export_user_history(
+    user_id: int,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    gzip: bool = False,
+    db: Session = Depends(get_db)
+):
+    # Check if user exists
+    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    filename = f"user-{user_id}.{format}"
+    media_type = MEDIA_TYPES[format]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+
+    logger.info(f"Streaming {format} export for user: {user_id}")
+    return StreamingResponse(
+        user_export.stream_user_export(db, user_id, format, gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -6,6 +6,7 @@ import logging
 import models
 import schemas
 from database import get_db
+from dose_scheduler import scheduler
 
 router = APIRouter(
     prefix="/users/{user_id}/prescriptions",
@@ -41,6 +42,7 @@ async def create_prescription(
     db.add(db_prescription)
     db.commit()
     db.refresh(db_prescription)
+    scheduler.upsert_prescription(db_prescription)
     logger.info(f"Successfully created prescription with ID: {db_prescription.id} for user: {user_id}")
     return db_prescription
 
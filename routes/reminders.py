@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Query
+from typing import List
+import logging
+
+import schemas
+from dose_scheduler import scheduler
+
+router = APIRouter(
+    prefix="/users/{user_id}",
+    tags=["reminders"]
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_NEXT_DOSES = 100
+
+@router.get("/next-doses", response_model=List[schemas.NextDoseResponse])
+def get_next_doses(user_id: int, limit: int = Query(5, ge=1, le=MAX_NEXT_DOSES)):
+    # Served from the in-memory scheduler, so this never touches the database.
+    # The lookup holds the scheduler lock, so the limit is capped to keep ticks prompt
+    return scheduler.next_doses(user_id, limit)
@@ -0,0 +1,86 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from datetime import datetime
+import logging
+
+import models
+import schemas
+import usage_archive
+from adherence import calculate_adherence_from_counts
+from database import get_db
+from dose_scheduler import scheduler
+
+router = APIRouter(
+    prefix="/users/{user_id}",
+    tags=["usage"]
+)
+
+logger = logging.getLogger(__name__)
+
+@router.post("/usage/", response_model=schemas.UsageResponse)
+async def create_usage(
+    user_id: int,
+    usage: schemas.UsageCreate,
+    db: Session = Depends(get_db)
+):
+    # Check if prescription exists for this user
+    db_prescription = db.query(models.Prescription).filter(
+        models.Prescription.id == usage.prescription_id,
+        models.Prescription.user_id == user_id
+    ).first()
+    if db_prescription is None:
+        raise HTTPException(status_code=404, detail="Prescription not found")
+
+    db_usage = models.Usage(
+        user_id=user_id,
+        prescription_id=usage.prescription_id,
+        taken_at=usage.taken_at
+    )
+
+    db.add(db_usage)
+    db.commit()
+    db.refresh(db_usage)
+    scheduler.record_usage(db_usage.prescription_id, db_usage.taken_at)
+    logger.info(f"Successfully logged usage with ID: {db_usage.id} for user: {user_id}")
+    return db_usage
+
+@router.get("/usage/", response_model=List[schemas.UsageResponse])
+def get_user_usage(
+    user_id: int,
+    prescription_id: Optional[int] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    # Check if user exists
+    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    # Reads both live and archived usage, newest first
+    return usage_archive.get_usage_logs(db, user_id, prescription_id, start_date, end_date)
+
+@router.get("/prescriptions/{prescription_id}/adherence", response_model=schemas.AdherenceResponse)
+def get_prescription_adherence(
+    user_id: int,
+    prescription_id: int,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    db_prescription = db.query(models.Prescription).filter(
+        models.Prescription.id == prescription_id,
+        models.Prescription.user_id == user_id
+    ).first()
+    if db_prescription is None:
+        raise HTTPException(status_code=404, detail="Prescription not found")
+
+    # Resolve the evaluation period up front so both tiers are read for the same range
+    start_date = start_date or db_prescription.start_date
+    end_date = end_date or db_prescription.end_date or datetime.now()
+
+    doses_by_date = usage_archive.usage_counts_by_date(
+        db, user_id, prescription_id, start_date, end_date
+    )
+    return calculate_adherence_from_counts(db_prescription, doses_by_date, start_date, end_date)
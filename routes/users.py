@@ -1,11 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
 import logging
 
 import models
+import purge
 import schemas
-from database import get_db
+from database import engine, get_db
+from dose_scheduler import scheduler
 
 router = APIRouter(
     prefix="/users",
@@ -61,11 +63,13 @@ def update_user(user_id: int, user: schemas.UserBase, db: Session = Depends(get_
     return db_user
 
 @router.delete("/{user_id}")
-def delete_user(user_id: int, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
-    if db_user is None:
+def delete_user(user_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    # Set-based delete of the user and all their records in one transaction
+    deleted = purge.purge_user(db, user_id)
+    if deleted is None:
         raise HTTPException(status_code=404, detail="User not found")
+    scheduler.remove_user(user_id)
     
-    db.delete(db_user)
-    db.commit()
-    return {"message": "User deleted successfully"} 
\ No newline at end of file
+    # Hand the freed pages back to the filesystem after the response is sent
+    background_tasks.add_task(purge.incremental_vacuum, engine)
+    return {"message": "User deleted successfully", "deleted": deleted} 
\ No newline at end of file
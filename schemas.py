@@ -66,4 +66,42 @@ class CheckInResponse(CheckInBase):
     user_id: int
     created_at: datetime
 
-    model_config = ConfigDict(from_attributes=True) 
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+class AdherenceResponse(BaseModel):
+    total_expected_doses: int
+    total_taken_doses: int
+    missed_doses: int
+    late_doses: int
+    missed_dates: List[datetime]
+    late_dates: List[datetime]
+    details: Dict[str, Any]
+
+    model_config = ConfigDict(from_attributes=True)
+
+class ImportReportResponse(BaseModel):
+    job: str
+    lines: int
+    inserted: Dict[str, int]
+    skipped: Dict[str, int]
+    rejected: int
+    rejected_examples: List[Dict[str, Any]]
+    elapsed_seconds: float
+    rows_per_second: float
+
+    model_config = ConfigDict(from_attributes=True)
+
+class NextDoseResponse(BaseModel):
+    prescription_id: int
+    medication_name: str
+    dosage: str
+    due_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+class CheckInFinalize(BaseModel):
+    side_effects: List[str] = []
+    red_flags: List[str] = []
+    mood: conint(ge=1, le=10)
+    clinical_effectiveness: List[str] = []
+    date: Optional[datetime] = None
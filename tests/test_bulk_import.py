@@ -0,0 +1,171 @@
+import io
+import json
+import pytest
+from datetime import datetime
+
+import models
+from bulk_import import CheckpointMismatchError, import_jsonl
+from user_export import stream_user_export
+
+def _jsonl(*records):
+    return io.BytesIO("".join(json.dumps(record) + "\n" for record in records).encode("utf-8"))
+
+def _user(source_id, email):
+    return {"record_type": "user", "id": source_id, "email": email, "full_name": f"User {source_id}"}
+
+def _prescription(source_id, user_id):
+    return {
+        "record_type": "prescription", "id": source_id, "user_id": user_id,
+        "medication_name": "Test Medication", "dosage": "100mg", "pills_per_dose": 1,
+        "times_per_day": 2, "start_date": "2024-01-01T00:00:00"
+    }
+
+def _usage(user_id, prescription_id, taken_at="2024-01-01T08:00:00"):
+    return {"record_type": "usage", "user_id": user_id, "prescription_id": prescription_id, "taken_at": taken_at}
+
+def _check_in(user_id):
+    return {
+        "record_type": "check_in", "user_id": user_id, "transcript": "Feeling fine",
+        "side_effects": [], "red_flags": [], "mood": 8, "clinical_effectiveness": []
+    }
+
+def test_import_maps_source_ids(db):
+    """Test that children are attached to the newly inserted parents"""
+    source = _jsonl(
+        _user(100, "a@example.com"),
+        _prescription(500, 100),
+        _usage(100, 500),
+        _usage(100, 500, "2024-01-01T20:00:00"),
+        _check_in(100),
+    )
+
+    report = import_jsonl(db, source, "job", chunk_size=2)
+
+    user = db.query(models.User).one()
+    prescription = db.query(models.Prescription).one()
+    assert report.lines == 5
+    assert report.inserted == {"user": 1, "prescription": 1, "usage": 2, "check_in": 1}
+    assert report.rejected == 0
+    assert prescription.user_id == user.id
+    assert {usage.prescription_id for usage in db.query(models.Usage)} == {prescription.id}
+    assert db.query(models.CheckIn).one().user_id == user.id
+
+@pytest.mark.parametrize("on_conflict,expected_usage_owner", [("skip", None), ("merge", "existing")])
+def test_import_email_conflicts(db, on_conflict, expected_usage_owner):
+    """Test that registered and repeated emails follow the conflict policy"""
+    existing = models.User(email="taken@example.com", full_name="Existing")
+    db.add(existing)
+    db.commit()
+    source = _jsonl(
+        _user(1, "taken@example.com"),
+        _user(2, "new@example.com"),
+        _user(3, "new@example.com"),
+        _prescription(10, 1),
+        _usage(1, 10),
+    )
+
+    report = import_jsonl(db, source, "job", on_conflict=on_conflict)
+
+    assert report.inserted["user"] == 1
+    assert report.skipped["user"] == 2
+    assert db.query(models.User).count() == 2
+    if expected_usage_owner is None:
+        assert report.skipped == {"user": 2, "prescription": 1, "usage": 1}
+        assert db.query(models.Usage).count() == 0
+    else:
+        assert db.query(models.Usage).one().user_id == existing.id
+
+def test_import_rejects_bad_lines(db):
+    """Test that invalid records and unknown parents are reported, not fatal"""
+    source = _jsonl(
+        _user(1, "not-an-email"),
+        {"record_type": "refill"},
+        _prescription(10, 99),
+        _usage(99, 10),
+        _user(2, "ok@example.com"),
+    )
+
+    report = import_jsonl(db, source, "job")
+
+    assert report.rejected == 4
+    assert [example["line"] for example in report.rejected_examples] == [1, 2, 3, 4]
+    assert report.inserted["user"] == 1
+
+def test_import_rejects_bad_created_at_line_only(db):
+    """Test that an unparseable created_at rejects its line without aborting the chunk"""
+    source = _jsonl(
+        {**_user(1, "a@example.com"), "created_at": "yesterday"},
+        {**_user(2, "b@example.com"), "created_at": "2023-05-01T09:30:00"},
+    )
+
+    report = import_jsonl(db, source, "job")
+
+    assert report.rejected == 1
+    assert report.rejected_examples[0]["line"] == 1
+    assert db.query(models.User).one().created_at == datetime(2023, 5, 1, 9, 30)
+
+class _FailingSource(io.BytesIO):
+    """Stream that raises after a number of lines, like a dropped connection"""
+
+    def __init__(self, data, fail_after):
+        super().__init__(data)
+        self.remaining = fail_after
+
+    def readline(self, *args):
+        if self.remaining == 0:
+            raise IOError("connection lost")
+        self.remaining -= 1
+        return super().readline(*args)
+
+def test_import_resumes_from_checkpoint(db):
+    """Test that a re-run continues after the last committed chunk without duplicates"""
+    records = [_user(1, "a@example.com"), _prescription(10, 1)]
+    records += [_usage(1, 10, f"2024-01-{day:02d}T08:00:00") for day in range(1, 11)]
+    data = _jsonl(*records).getvalue()
+
+    with pytest.raises(IOError):
+        import_jsonl(db, _FailingSource(data, fail_after=10), "job", chunk_size=4)
+    assert db.query(models.Usage).count() == 6
+    assert db.query(models.ImportCheckpoint).one().lines == 8
+
+    report = import_jsonl(db, io.BytesIO(data), "job", chunk_size=4)
+
+    assert report.lines == 12
+    assert report.inserted == {"user": 1, "prescription": 1, "usage": 10, "check_in": 0}
+    assert db.query(models.User).count() == 1
+    assert db.query(models.Usage).count() == 10
+
+def test_import_refuses_different_input_for_job(db):
+    """Test that a job name reused for another file is refused instead of resumed"""
+    import_jsonl(db, _jsonl(_user(1, "a@example.com")), "clinic.jsonl")
+
+    with pytest.raises(CheckpointMismatchError):
+        import_jsonl(db, _jsonl(_user(1, "b@example.com"), _user(2, "c@example.com")), "clinic.jsonl")
+
+    report = import_jsonl(db, _jsonl(_user(1, "b@example.com"), _user(2, "c@example.com")), "clinic-2.jsonl")
+    assert report.inserted["user"] == 2
+    assert db.query(models.User).count() == 3
+
+def test_import_round_trips_export(db):
+    """Test that an export can be imported into another database"""
+    user = models.User(email="a@example.com", full_name="A")
+    db.add(user)
+    db.commit()
+    prescription = models.Prescription(
+        user_id=user.id, medication_name="Test Medication", dosage="100mg",
+        pills_per_dose=1, times_per_day=2, start_date=datetime(2024, 1, 1)
+    )
+    db.add(prescription)
+    db.commit()
+    db.add(models.Usage(user_id=user.id, prescription_id=prescription.id, taken_at=datetime(2024, 1, 1, 8)))
+    db.commit()
+    exported = b"".join(stream_user_export(db, user.id))
+    db.query(models.Usage).delete()
+    db.query(models.Prescription).delete()
+    db.query(models.User).delete()
+    db.commit()
+
+    report = import_jsonl(db, io.BytesIO(exported), "restore")
+
+    assert report.inserted == {"user": 1, "prescription": 1, "usage": 1, "check_in": 0}
+    assert db.query(models.Usage).one().taken_at == datetime(2024, 1, 1, 8)
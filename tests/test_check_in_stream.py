@@ -0,0 +1,222 @@
+import asyncio
+import json
+import tracemalloc
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from starlette.websockets import WebSocketDisconnect
+
+import models
+import schemas
+from database import get_db
+from check_in_stream import TranscriptStream
+from routes import check_ins
+
+METADATA = {"mood": 7, "side_effects": ["headache"], "red_flags": [], "clinical_effectiveness": ["sleeping better"]}
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Fixture to create an on-disk database shared by concurrent connections"""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'stream.db'}", connect_args={"check_same_thread": False, "timeout": 30}
+    )
+    models.Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = factory()
+    db.add(models.User(email="test@example.com", full_name="Test User"))
+    db.commit()
+    db.close()
+    yield factory
+    engine.dispose()
+
+@pytest.fixture
+def client(session_factory):
+    """Fixture to create a test client for the check-ins router"""
+    app = FastAPI()
+    app.include_router(check_ins.router)
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    return TestClient(app)
+
+def _stored(session_factory, check_in_id):
+    db = session_factory()
+    try:
+        check_in = db.get(models.CheckIn, check_in_id)
+        draft = db.get(models.CheckInDraft, check_in_id)
+        return check_in, draft
+    finally:
+        db.close()
+
+def test_stream_and_finalize(client, session_factory):
+    """Test that streamed chunks become a regular check-in on finalize"""
+    with client.websocket_connect("/users/1/check-ins/stream") as websocket:
+        session = websocket.receive_json()
+        for seq, text in enumerate(["I slept ", "well but ", "had a headache."], start=1):
+            websocket.send_json({"type": "chunk", "seq": seq, "text": text})
+        websocket.send_json({"type": "finalize", **METADATA})
+        finalized = websocket.receive_json()
+
+    assert session == {"type": "session", "check_in_id": finalized["check_in"]["id"], "last_seq": 0}
+    assert finalized["check_in"]["transcript"] == "I slept well but had a headache."
+    assert finalized["check_in"]["mood"] == 7
+    check_in, draft = _stored(session_factory, session["check_in_id"])
+    assert draft is None
+    assert client.get("/users/1/check-ins/").json()[0]["transcript"] == "I slept well but had a headache."
+
+def test_drafts_are_hidden_and_resumable(client, session_factory):
+    """Test that a dropped stream keeps its draft and resumes after the last stored chunk"""
+    with client.websocket_connect("/users/1/check-ins/stream") as websocket:
+        check_in_id = websocket.receive_json()["check_in_id"]
+        websocket.send_json({"type": "chunk", "seq": 1, "text": "First part. "})
+        websocket.send_json({"type": "chunk", "seq": 2, "text": "Second part. "})
+        websocket.close(code=1001)
+
+    assert client.get("/users/1/check-ins/").json() == []
+    assert client.get(f"/users/1/check-ins/{check_in_id}").status_code == 404
+
+    with client.websocket_connect(f"/users/1/check-ins/stream?check_in_id={check_in_id}") as websocket:
+        session = websocket.receive_json()
+        # The client re-sends everything it is unsure about; duplicates are ignored
+        for seq, text in [(2, "Second part. "), (3, "Third part.")]:
+            websocket.send_json({"type": "chunk", "seq": seq, "text": text})
+        websocket.send_json({"type": "metadata", **METADATA})
+        websocket.close(code=1000)
+
+    assert session["last_seq"] == 2
+    check_in, draft = _stored(session_factory, check_in_id)
+    assert check_in.transcript == "First part. Second part. Third part."
+    assert draft is None
+    assert client.get(f"/users/1/check-ins/{check_in_id}").json()["mood"] == 7
+
+def test_stream_rejects_unknown_user_and_draft(client):
+    """Test that unknown users and drafts are refused before accepting"""
+    for path in ["/users/99/check-ins/stream", "/users/1/check-ins/stream?check_in_id=12345"]:
+        with pytest.raises(WebSocketDisconnect) as exc_info:
+            with client.websocket_connect(path):
+                pass
+        assert exc_info.value.code == 4404
+
+def test_stream_reports_invalid_messages(client):
+    """Test that bad messages get an error reply without ending the stream"""
+    with client.websocket_connect("/users/1/check-ins/stream") as websocket:
+        websocket.receive_json()
+        websocket.send_json({"type": "shout"})
+        unsupported = websocket.receive_json()
+        websocket.send_json({"type": "finalize", "mood": 11})
+        invalid = websocket.receive_json()
+        bad_seqs = []
+        for seq in ["2", [1], {}, 1.5, True, 0, -3]:
+            websocket.send_json({"type": "chunk", "seq": seq, "text": "dropped "})
+            bad_seqs.append(websocket.receive_json())
+        websocket.send_json({"type": "chunk", "seq": 1, "text": "kept"})
+        websocket.send_json({"type": "finalize", **METADATA})
+        finalized = websocket.receive_json()
+
+    assert unsupported == {"type": "error", "detail": "Unsupported message"}
+    assert invalid["type"] == "error"
+    assert bad_seqs == [{"type": "error", "detail": "seq must be a positive integer"}] * 7
+    assert finalized["type"] == "finalized"
+    assert finalized["check_in"]["transcript"] == "kept"
+
+def test_stream_survives_malformed_frames(client, session_factory):
+    """Test that a non-JSON frame gets an error reply and buffered chunks are kept on disconnect"""
+    with client.websocket_connect("/users/1/check-ins/stream") as websocket:
+        check_in_id = websocket.receive_json()["check_in_id"]
+        websocket.send_json({"type": "chunk", "seq": 1, "text": "Kept. "})
+        websocket.send_text("{not json")
+        error = websocket.receive_json()
+        websocket.send_bytes(b"\x00")
+        binary_error = websocket.receive_json()
+        websocket.close(code=1001)
+
+    assert error["type"] == binary_error["type"] == "error"
+    check_in, draft = _stored(session_factory, check_in_id)
+    assert check_in.transcript == "Kept. "
+    assert draft.last_seq == 1
+
+def test_stale_stream_does_not_append_twice(session_factory):
+    """Test that a stream left open after its client resumed elsewhere skips chunks already stored"""
+    stale_db, resumed_db = session_factory(), session_factory()
+    stale = TranscriptStream.open(stale_db, 1)
+    stale.add("one ", 1)
+    stale.add("two ", 2)
+
+    resumed = TranscriptStream.open(resumed_db, 1, stale.check_in_id)
+    for seq, text in [(1, "one "), (2, "two "), (3, "three ")]:
+        resumed.add(text, seq)
+    assert resumed.flush() is True
+
+    stale.add("four ", 4)
+    assert stale.flush() is True
+    assert resumed.finalize(schemas.CheckInFinalize(mood=5)).transcript == "one two three four "
+
+    stale.add("five", 5)
+    assert stale.flush() is False
+    assert stale.finalize(schemas.CheckInFinalize(mood=5)) is None
+    stale_db.close()
+    resumed_db.close()
+
+    check_in, draft = _stored(session_factory, stale.check_in_id)
+    assert check_in.transcript == "one two three four "
+    assert check_in.mood == 5
+    assert draft is None
+
+async def _voice_session(app, chunks, text):
+    """Play one client against the ASGI app, yielding between chunks like a live producer"""
+    incoming, outgoing = asyncio.Queue(), []
+    scope = {
+        "type": "websocket", "asgi": {"version": "3.0"}, "scheme": "ws", "path": "/users/1/check-ins/stream",
+        "raw_path": b"/users/1/check-ins/stream", "query_string": b"", "root_path": "", "headers": [],
+        "client": ("testclient", 50000), "server": ("testserver", 80), "subprotocols": [],
+    }
+
+    async def send(message):
+        outgoing.append(message)
+
+    async def client():
+        await incoming.put({"type": "websocket.connect"})
+        for seq in range(1, chunks + 1):
+            await incoming.put({"type": "websocket.receive", "text": json.dumps({"type": "chunk", "seq": seq, "text": text})})
+            await asyncio.sleep(0)
+        await incoming.put({"type": "websocket.receive", "text": json.dumps({"type": "finalize", **METADATA})})
+
+    await asyncio.gather(app(scope, incoming.get, send), client())
+    replies = [json.loads(message["text"]) for message in outgoing if message["type"] == "websocket.send"]
+    return replies[-1]
+
+def test_concurrent_sessions_batch_writes(client, session_factory):
+    """Test write batching and memory with many concurrent sessions on one event loop"""
+    sessions, chunks = 100, 100
+    text = "word " * 20
+    updates = []
+    event.listen(
+        session_factory.kw["bind"], "before_cursor_execute",
+        lambda conn, cursor, statement, *args: updates.append(statement) if statement.startswith("UPDATE check_ins") else None
+    )
+
+    async def run_all():
+        return await asyncio.gather(*(_voice_session(client.app, chunks, text) for _ in range(sessions)))
+
+    tracemalloc.start()
+    finalized = asyncio.run(run_all())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert [reply["type"] for reply in finalized] == ["finalized"] * sessions
+    for reply in finalized:
+        check_in, draft = _stored(session_factory, reply["check_in"]["id"])
+        assert check_in.transcript == text * chunks
+        assert draft is None
+    # Each session buffers up to FLUSH_CHARS of text, so there are far fewer writes than chunks
+    assert len(updates) < sessions * chunks / 10
+    assert peak < 50 * 1024 * 1024
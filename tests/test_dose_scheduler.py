@@ -0,0 +1,170 @@
+import pytest
+from datetime import datetime, time
+from types import SimpleNamespace
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import models
+from dose_scheduler import DoseScheduler, ReminderSink, dose_times
+from routes import reminders
+
+class RecordingSink(ReminderSink):
+    def __init__(self):
+        self.sent = []
+
+    def send(self, reminder):
+        self.sent.append((reminder.prescription_id, reminder.due_at))
+
+def _prescription(prescription_id, user_id=1, times_per_day=2, end_date=None, metadata=None):
+    return SimpleNamespace(
+        id=prescription_id, user_id=user_id, medication_name=f"Medication {prescription_id}",
+        dosage="100mg", times_per_day=times_per_day, start_date=datetime(2024, 1, 1),
+        end_date=end_date, prescription_metadata=metadata
+    )
+
+@pytest.fixture
+def sink():
+    return RecordingSink()
+
+@pytest.fixture
+def scheduler(sink):
+    return DoseScheduler(sink=sink)
+
+def test_dose_times():
+    """Test default spreads and configured dose times"""
+    assert dose_times(1) == (time(8, 0),)
+    assert dose_times(3) == (time(8, 0), time(14, 0), time(20, 0))
+    assert dose_times(2, {"dose_times": ["21:30", "09:15"]}) == (time(9, 15), time(21, 30))
+    assert dose_times(2, {"dose_times": ["noon"]}) == (time(8, 0), time(20, 0))
+
+def test_tick_sends_due_reminders(scheduler, sink):
+    """Test that each due dose is sent once and the next one is scheduled"""
+    scheduler.load_prescriptions([_prescription(1), _prescription(2, times_per_day=1)], now=datetime(2024, 3, 1, 7))
+
+    assert scheduler.tick(datetime(2024, 3, 1, 7, 59)) == 0
+    assert scheduler.tick(datetime(2024, 3, 1, 8, 0)) == 2
+    assert scheduler.tick(datetime(2024, 3, 1, 8, 0)) == 0
+    assert scheduler.tick(datetime(2024, 3, 2, 8, 0)) == 3
+    assert sink.sent[:2] == [(1, datetime(2024, 3, 1, 8)), (2, datetime(2024, 3, 1, 8))]
+    assert sink.sent[2:] == [(1, datetime(2024, 3, 1, 20)), (1, datetime(2024, 3, 2, 8)), (2, datetime(2024, 3, 2, 8))]
+
+def test_prescription_stops_at_end_date(scheduler, sink):
+    """Test that ended prescriptions leave the scheduler"""
+    scheduler.upsert_prescription(_prescription(1, end_date=datetime(2024, 3, 1, 12)), now=datetime(2024, 3, 1, 7))
+
+    assert scheduler.tick(datetime(2024, 3, 5)) == 1
+    assert len(scheduler) == 0
+    assert scheduler.next_doses(1) == []
+
+def test_usage_marks_upcoming_dose_taken(scheduler, sink):
+    """Test that an early dose suppresses its reminder but much earlier or later ones do not"""
+    scheduler.upsert_prescription(_prescription(1), now=datetime(2024, 3, 1, 5))
+
+    scheduler.record_usage(1, datetime(2024, 3, 1, 5, 30))
+    assert scheduler.next_doses(1, limit=1)[0].due_at == datetime(2024, 3, 1, 8)
+
+    scheduler.record_usage(1, datetime(2024, 3, 1, 7, 30))
+    assert scheduler.next_doses(1, limit=1)[0].due_at == datetime(2024, 3, 1, 20)
+    assert scheduler.tick(datetime(2024, 3, 1, 12)) == 0
+
+    scheduler.record_usage(1, datetime(2024, 3, 5, 8))
+    assert scheduler.next_doses(1, limit=1)[0].due_at == datetime(2024, 3, 1, 20)
+
+def test_upsert_replaces_stale_heap_entries(scheduler, sink):
+    """Test that re-added prescriptions do not fire from their old heap entries"""
+    scheduler.upsert_prescription(_prescription(1), now=datetime(2024, 3, 1, 7))
+    scheduler.remove_prescription(1)
+    scheduler.upsert_prescription(_prescription(1, metadata={"dose_times": ["10:00"]}), now=datetime(2024, 3, 1, 7))
+
+    assert scheduler.tick(datetime(2024, 3, 1, 10)) == 1
+    assert sink.sent == [(1, datetime(2024, 3, 1, 10))]
+
+def test_load_reads_prescriptions_without_holding_lock(scheduler, sink):
+    """Test that updates made while a reload reads its input are not blocked and survive the swap"""
+    scheduler.load_prescriptions([_prescription(1), _prescription(2)], now=datetime(2024, 3, 1, 7))
+
+    def slow_cursor():
+        yield _prescription(1)
+        yield _prescription(2)
+        assert not scheduler._lock.locked()
+        scheduler.upsert_prescription(_prescription(3, times_per_day=1), now=datetime(2024, 3, 1, 7))
+        scheduler.remove_prescription(2)
+        scheduler.record_usage(1, datetime(2024, 3, 1, 7, 45))
+
+    scheduler.load_prescriptions(slow_cursor(), now=datetime(2024, 3, 1, 7))
+
+    assert len(scheduler) == 2
+    assert [(dose.prescription_id, dose.due_at) for dose in scheduler.next_doses(1, limit=2)] == [
+        (3, datetime(2024, 3, 1, 8)),
+        (1, datetime(2024, 3, 1, 20)),
+    ]
+    assert scheduler.tick(datetime(2024, 3, 1, 8)) == 1
+    assert sink.sent == [(3, datetime(2024, 3, 1, 8))]
+
+def test_next_doses_across_prescriptions(scheduler):
+    """Test that next doses merge a user's prescriptions and ignore other users"""
+    scheduler.load_prescriptions([
+        _prescription(1),
+        _prescription(2, metadata={"dose_times": ["12:00"]}),
+        _prescription(3, user_id=2),
+    ], now=datetime(2024, 3, 1, 9))
+
+    doses = scheduler.next_doses(1, limit=4)
+
+    assert [(dose.prescription_id, dose.due_at) for dose in doses] == [
+        (2, datetime(2024, 3, 1, 12)),
+        (1, datetime(2024, 3, 1, 20)),
+        (1, datetime(2024, 3, 2, 8)),
+        (2, datetime(2024, 3, 2, 12)),
+    ]
+    scheduler.remove_user(1)
+    assert scheduler.next_doses(1) == []
+    assert len(scheduler) == 1
+
+def test_load_from_database(db, scheduler):
+    """Test that loading skips ended prescriptions and applies the latest dose"""
+    user = models.User(email="test@example.com", full_name="Test User")
+    db.add(user)
+    db.commit()
+    active = models.Prescription(
+        user_id=user.id, medication_name="Active", dosage="100mg", pills_per_dose=1,
+        times_per_day=2, start_date=datetime(2024, 1, 1)
+    )
+    ended = models.Prescription(
+        user_id=user.id, medication_name="Ended", dosage="100mg", pills_per_dose=1,
+        times_per_day=2, start_date=datetime(2024, 1, 1), end_date=datetime(2024, 2, 1)
+    )
+    db.add_all([active, ended])
+    db.commit()
+    db.add(models.Usage(user_id=user.id, prescription_id=active.id, taken_at=datetime(2024, 3, 1, 7, 45)))
+    db.commit()
+
+    scheduler.load(db, now=datetime(2024, 3, 1, 7, 50))
+
+    assert len(scheduler) == 1
+    assert scheduler.next_doses(user.id, limit=1)[0].due_at == datetime(2024, 3, 1, 20)
+
+def test_failing_sink_does_not_stop_tick(sink):
+    """Test that a sink error is logged and the remaining reminders are still sent"""
+    class FlakySink(RecordingSink):
+        def send(self, reminder):
+            if reminder.prescription_id == 1:
+                raise RuntimeError("push service down")
+            super().send(reminder)
+
+    flaky = FlakySink()
+    scheduler = DoseScheduler(sink=flaky)
+    scheduler.load_prescriptions([_prescription(1), _prescription(2)], now=datetime(2024, 3, 1, 7))
+
+    assert scheduler.tick(datetime(2024, 3, 1, 8)) == 2
+    assert flaky.sent == [(2, datetime(2024, 3, 1, 8))]
+
+@pytest.mark.parametrize("limit,status_code", [(0, 422), (-1, 422), (100, 200), (101, 422)])
+def test_next_doses_endpoint_bounds_limit(limit, status_code):
+    """Test that the endpoint refuses limits that would hold the scheduler lock for long"""
+    app = FastAPI()
+    app.include_router(reminders.router)
+
+    response = TestClient(app).get(f"/users/1/next-doses?limit={limit}")
+
+    assert response.status_code == status_code
@@ -0,0 +1,109 @@
+import pytest
+from datetime import datetime
+from sqlalchemy import create_engine, event, insert, text
+from sqlalchemy.orm import sessionmaker
+
+import models
+import purge
+import usage_archive
+
+def _add_patient(db, email, doses=3):
+    """Create a user with a prescription, usage and a check-in"""
+    user = models.User(email=email, full_name="Test User")
+    db.add(user)
+    db.commit()
+    prescription = models.Prescription(
+        user_id=user.id, medication_name="Test Medication", dosage="100mg",
+        pills_per_dose=1, times_per_day=1, start_date=datetime(2024, 1, 1)
+    )
+    db.add(prescription)
+    db.commit()
+    for day in range(1, doses + 1):
+        db.add(models.Usage(user_id=user.id, prescription_id=prescription.id, taken_at=datetime(2024, 1, day, 8)))
+    db.add(models.CheckIn(
+        user_id=user.id, transcript="Fine", side_effects=[], red_flags=[],
+        mood=7, clinical_effectiveness=[]
+    ))
+    db.commit()
+    return user, prescription
+
+def test_purge_user_deletes_all_records(db):
+    """Test that purging removes the user's rows in every table and nothing else"""
+    user, _ = _add_patient(db, "gone@example.com")
+    other, _ = _add_patient(db, "kept@example.com")
+    usage_archive.compact_usage(db, horizon_days=0, now=datetime(2024, 3, 1))
+    db.add(models.Usage(user_id=user.id, prescription_id=None, taken_at=datetime(2024, 3, 2)))
+    db.commit()
+
+    deleted = purge.purge_user(db, user.id)
+
+    assert deleted == {
+        "usage": 1, "usage_archive": 1, "check_in_drafts": 0, "check_ins": 1,
+        "import_id_map": 0, "prescriptions": 1, "users": 1
+    }
+    assert db.query(models.User).one().id == other.id
+    assert db.query(models.UsageArchive).one().user_id == other.id
+    assert {row.user_id for row in db.query(models.CheckIn)} == {other.id}
+
+def test_purge_unknown_user(db):
+    """Test that purging a missing user reports it without deleting anything"""
+    _add_patient(db, "kept@example.com")
+
+    assert purge.purge_user(db, 999) is None
+    assert db.query(models.Usage).count() == 3
+
+def test_sweep_orphans(db):
+    """Test that rows left behind by the old ORM delete are swept in batches"""
+    user, prescription = _add_patient(db, "gone@example.com", doses=5)
+    other, _ = _add_patient(db, "kept@example.com")
+    # What the previous delete_user left behind: only the users row was removed
+    db.execute(text("DELETE FROM users WHERE id = :id"), {"id": user.id})
+    db.commit()
+
+    swept = purge.sweep_orphans(db, batch_size=2)
+
+    assert swept == {"prescriptions": 1, "usage": 5, "usage_archive": 0, "check_ins": 1, "check_in_drafts": 0}
+    assert {row.user_id for row in db.query(models.Usage)} == {other.id}
+    assert purge.sweep_orphans(db) == {
+        "prescriptions": 0, "usage": 0, "usage_archive": 0, "check_ins": 0, "check_in_drafts": 0
+    }
+
+@pytest.fixture
+def file_engine(tmp_path):
+    """Fixture to create an on-disk database with incremental auto_vacuum"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'purge.db'}")
+
+    @event.listens_for(engine, "connect")
+    def set_auto_vacuum(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+    models.Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+def test_incremental_vacuum_reclaims_pages(file_engine):
+    """Test that freed pages are returned in small steps after a purge"""
+    db = sessionmaker(bind=file_engine)()
+    user, prescription = _add_patient(db, "gone@example.com", doses=0)
+    db.execute(insert(models.CheckIn), [
+        {"user_id": user.id, "transcript": "x" * 2000, "side_effects": [], "red_flags": [],
+         "mood": 5, "clinical_effectiveness": []}
+        for _ in range(500)
+    ])
+    db.commit()
+
+    purge.purge_user(db, user.id)
+    with file_engine.connect() as connection:
+        free_pages = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+
+    freed = purge.incremental_vacuum(file_engine, pages_per_step=50, pause_seconds=0)
+
+    with file_engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA freelist_count").scalar() == 0
+    assert free_pages > 50
+    assert freed == free_pages
+    db.close()
+
+def test_incremental_vacuum_requires_incremental_mode(db):
+    """Test that vacuum is a no-op when auto_vacuum is not INCREMENTAL"""
+    assert purge.incremental_vacuum(db.get_bind(), pause_seconds=0) == 0
@@ -0,0 +1,220 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+import models
+import usage_archive
+from adherence import calculate_adherence, calculate_adherence_from_counts
+
+@pytest.fixture
+def prescription(db):
+    """Fixture to create a twice daily prescription with two months of usage"""
+    user = models.User(email="test@example.com", full_name="Test User")
+    db.add(user)
+    db.commit()
+
+    prescription = models.Prescription(
+        user_id=user.id,
+        medication_name="Test Medication",
+        dosage="100mg",
+        pills_per_dose=1,
+        times_per_day=2,
+        start_date=datetime(2024, 1, 1),
+        end_date=datetime(2024, 2, 29)
+    )
+    db.add(prescription)
+    db.commit()
+
+    day = datetime(2024, 1, 1)
+    while day <= datetime(2024, 2, 29):
+        # Skip the evening dose every fifth day, take an extra one on the 10th
+        taken = [day.replace(hour=8, minute=3, second=7, microsecond=120)]
+        if day.day % 5:
+            taken.append(day.replace(hour=20))
+        if day.day == 10:
+            taken.append(day.replace(hour=23, minute=30))
+        for taken_at in taken:
+            db.add(models.Usage(
+                user_id=user.id,
+                prescription_id=prescription.id,
+                taken_at=taken_at,
+                created_at=taken_at + timedelta(minutes=1)
+            ))
+        day += timedelta(days=1)
+    db.commit()
+    return prescription
+
+def _snapshot(logs):
+    return [(log.id, log.taken_at, log.created_at) for log in logs]
+
+def test_dose_encoding_round_trip():
+    """Test that ids and exact timestamps survive encoding"""
+    month = datetime(2024, 3, 1)
+    doses = [
+        (17, datetime(2024, 3, 1, 8, 0, 0, 5), datetime(2024, 3, 1, 7, 59)),
+        (12, datetime(2024, 3, 1, 20, 15), None),
+        (40, datetime(2024, 3, 31, 23, 59, 59, 999999), datetime(2024, 4, 2, 9, 0)),
+    ]
+
+    encoded = usage_archive.encode_doses(month, doses)
+
+    assert usage_archive.decode_doses(month, encoded) == doses
+    assert len(encoded) < 40
+
+def test_bitmap_counts_caps_at_slots():
+    """Test that the bitmap records at most one bit per slot per day"""
+    month = datetime(2024, 2, 1)
+    doses = [
+        (1, datetime(2024, 2, 1, 8), None),
+        (2, datetime(2024, 2, 1, 12), None),
+        (3, datetime(2024, 2, 1, 20), None),
+        (4, datetime(2024, 2, 29, 8), None),
+    ]
+
+    bitmap = usage_archive.encode_bitmap(month, 2, doses)
+    counts = usage_archive.bitmap_counts(month, 2, bitmap)
+
+    assert len(bitmap) == (29 * 2 + 7) // 8
+    assert counts == {datetime(2024, 2, 1).date(): 2, datetime(2024, 2, 29).date(): 1}
+
+def test_compaction_preserves_usage_logs(db, prescription):
+    """Test that listing reads the same logs before and after compaction"""
+    before = _snapshot(usage_archive.get_usage_logs(db, prescription.user_id))
+
+    result = usage_archive.compact_usage(db, horizon_days=0, now=datetime(2024, 3, 15))
+
+    assert result.cutoff == datetime(2024, 3, 1)
+    assert result.rows_archived == len(before)
+    assert result.months_written == 2
+    assert db.query(models.Usage).count() == 0
+    assert db.query(models.UsageArchive).count() == 2
+    assert _snapshot(usage_archive.get_usage_logs(db, prescription.user_id)) == before
+
+def test_new_usage_ids_stay_unique_after_compaction(db, prescription):
+    """Test that usage logged after archiving every row does not reuse archived ids"""
+    usage_archive.compact_usage(db, horizon_days=0, now=datetime(2024, 3, 15))
+    db.add(models.Usage(
+        user_id=prescription.user_id, prescription_id=prescription.id, taken_at=datetime(2024, 3, 14, 8)
+    ))
+    db.commit()
+
+    ids = [log.id for log in usage_archive.get_usage_logs(db, prescription.user_id)]
+
+    assert len(ids) == len(set(ids))
+
+def test_enable_usage_autoincrement(tmp_path):
+    """Test that a legacy usage table is refused, then rebuilt to continue after archived ids"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE usage"))
+        connection.execute(text(
+            "CREATE TABLE usage (id INTEGER NOT NULL, user_id INTEGER, prescription_id INTEGER, "
+            "taken_at DATETIME, created_at DATETIME, PRIMARY KEY (id))"
+        ))
+    db = sessionmaker(bind=engine)()
+    db.add_all([models.Usage(id=dose_id, user_id=1, prescription_id=1, taken_at=datetime(2024, 1, dose_id, 8))
+                for dose_id in (1, 2, 3)])
+    db.add(models.Usage(id=4, user_id=1, prescription_id=1, taken_at=datetime(2024, 3, 1, 8)))
+    db.commit()
+    with pytest.raises(RuntimeError):
+        usage_archive.compact_usage(db, horizon_days=0, now=datetime(2024, 3, 15))
+    db.close()
+
+    # Archive the highest id by hand, as a compaction on the legacy table would have
+    dose = (4, datetime(2024, 3, 1, 8), datetime(2024, 3, 1, 8, 1))
+    db = sessionmaker(bind=engine)()
+    db.query(models.Usage).filter(models.Usage.id == 4).delete()
+    db.add(models.UsageArchive(
+        user_id=1, prescription_id=1, month=datetime(2024, 3, 1), slots_per_day=1, dose_count=1,
+        taken_bitmap=usage_archive.encode_bitmap(datetime(2024, 3, 1), 1, [dose]),
+        doses=usage_archive.encode_doses(datetime(2024, 3, 1), [dose])
+    ))
+    db.commit()
+    db.close()
+
+    assert usage_archive.enable_usage_autoincrement(engine) is True
+    assert usage_archive.enable_usage_autoincrement(engine) is False
+
+    db = sessionmaker(bind=engine)()
+    usage_archive.compact_usage(db, horizon_days=0, now=datetime(2024, 2, 15))
+    new_usage = models.Usage(user_id=1, prescription_id=1, taken_at=datetime(2024, 3, 10, 8))
+    db.add(new_usage)
+    db.commit()
+    ids = [log.id for log in usage_archive.get_usage_logs(db, 1)]
+    db.close()
+    engine.dispose()
+
+    assert new_usage.id == 5
+    assert sorted(ids) == [1, 2, 3, 4, 5]
+
+def test_archived_reads_accept_aware_ranges(db, prescription):
+    """Test that timezone-aware bounds work once usage has been archived"""
+    start_date = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    end_date = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    naive_start, naive_end = (value.astimezone().replace(tzinfo=None) for value in (start_date, end_date))
+    expected_logs = _snapshot(usage_archive.get_usage_logs(db, prescription.user_id, None, naive_start, naive_end))
+    expected_counts = usage_archive.usage_counts_by_date(
+        db, prescription.user_id, prescription.id, naive_start, naive_end
+    )
+
+    usage_archive.compact_usage(db, horizon_days=0, now=datetime(2024, 3, 15))
+
+    logs = usage_archive.get_usage_logs(db, prescription.user_id, None, start_date, end_date)
+    counts = usage_archive.usage_counts_by_date(db, prescription.user_id, prescription.id, start_date, end_date)
+    assert _snapshot(logs) == expected_logs
+    assert counts == expected_counts
+
+def test_compaction_only_archives_whole_months(db, prescription):
+    """Test that the month containing the horizon stays live"""
+    result = usage_archive.compact_usage(db, horizon_days=10, now=datetime(2024, 2, 20))
+
+    assert result.cutoff == datetime(2024, 2, 1)
+    assert result.months_written == 1
+    assert db.query(models.Usage).filter(models.Usage.taken_at < datetime(2024, 2, 1)).count() == 0
+    assert db.query(models.Usage).count() > 0
+
+def test_compaction_merges_late_rows(db, prescription):
+    """Test that rows inserted into an archived month are merged on the next run"""
+    usage_archive.compact_usage(db, horizon_days=0, now=datetime(2024, 3, 15))
+    db.add(models.Usage(
+        user_id=prescription.user_id,
+        prescription_id=prescription.id,
+        taken_at=datetime(2024, 1, 5, 20, 0),
+        created_at=datetime(2024, 3, 20)
+    ))
+    db.commit()
+
+    result = usage_archive.compact_usage(db, horizon_days=0, now=datetime(2024, 3, 15))
+    logs = usage_archive.get_usage_logs(
+        db, prescription.user_id,
+        start_date=datetime(2024, 1, 5), end_date=datetime(2024, 1, 5, 23, 59)
+    )
+
+    assert result.rows_archived == 1
+    assert db.query(models.UsageArchive).count() == 2
+    assert len(logs) == 2
+
+@pytest.mark.parametrize("start_date,end_date", [
+    (None, None),
+    (datetime(2024, 1, 1), datetime(2024, 3, 1)),
+    (datetime(2024, 1, 5, 12), datetime(2024, 2, 10, 9)),
+])
+def test_adherence_matches_across_tiers(db, prescription, start_date, end_date):
+    """Test that adherence is identical whether usage is live or archived"""
+    start_date = start_date or prescription.start_date
+    end_date = end_date or prescription.end_date
+    logs = usage_archive.get_usage_logs(db, prescription.user_id, prescription.id)
+    expected = calculate_adherence(prescription, logs, start_date, end_date)
+
+    usage_archive.compact_usage(db, horizon_days=0, now=datetime(2024, 3, 15))
+    counts = usage_archive.usage_counts_by_date(
+        db, prescription.user_id, prescription.id, start_date, end_date
+    )
+    result = calculate_adherence_from_counts(prescription, counts, start_date, end_date)
+
+    assert result.total_expected_doses == expected.total_expected_doses
+    assert result.total_taken_doses == expected.total_taken_doses
+    assert result.missed_doses == expected.missed_doses
+    assert result.late_doses == expected.late_doses
@@ -0,0 +1,132 @@
+import csv
+import gzip
+import io
+import json
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import models
+import usage_archive
+from check_in_stream import TranscriptStream
+from user_export import iter_user_records, stream_user_export
+
+@pytest.fixture
+def user(db):
+    """Fixture to create a user with a prescription, usage and a check-in"""
+    user = models.User(email="test@example.com", full_name="Test User")
+    db.add(user)
+    db.commit()
+
+    prescription = models.Prescription(
+        user_id=user.id,
+        medication_name="Test Medication",
+        dosage="100mg",
+        pills_per_dose=1,
+        times_per_day=1,
+        special_instructions=["Take with food"],
+        start_date=datetime(2024, 1, 1)
+    )
+    db.add(prescription)
+    db.commit()
+
+    for day in range(60):
+        taken_at = datetime(2024, 1, 1, 8) + timedelta(days=day)
+        db.add(models.Usage(
+            user_id=user.id,
+            prescription_id=prescription.id,
+            taken_at=taken_at,
+            created_at=taken_at
+        ))
+    db.add(models.CheckIn(
+        user_id=user.id,
+        transcript="Feeling better, slight headache",
+        side_effects=["headache"],
+        red_flags=[],
+        mood=7,
+        clinical_effectiveness=["improved sleep"],
+        date=datetime(2024, 2, 1)
+    ))
+    db.commit()
+    return user
+
+def _read(chunks, compressed=False):
+    data = b"".join(chunks)
+    if compressed:
+        data = gzip.decompress(data)
+    return data.decode("utf-8")
+
+def test_ndjson_export(db, user):
+    """Test that every record is exported as one JSON line"""
+    lines = _read(stream_user_export(db, user.id, "ndjson", batch_size=7)).splitlines()
+    records = [json.loads(line) for line in lines]
+    types = [record["record_type"] for record in records]
+
+    assert types == ["user", "prescription"] + ["usage"] * 60 + ["check_in"]
+    assert records[0]["email"] == "test@example.com"
+    assert records[1]["special_instructions"] == ["Take with food"]
+    assert records[2]["taken_at"] == "2024-01-01T08:00:00"
+    assert records[-1]["side_effects"] == ["headache"]
+
+def test_export_skips_check_in_drafts(db, user):
+    """Test that check-ins still being streamed are not exported"""
+    draft = TranscriptStream.open(db, user.id)
+    draft.add("Half a sentence")
+    draft.flush()
+
+    records = [json.loads(line) for line in _read(stream_user_export(db, user.id, "ndjson")).splitlines()]
+
+    assert [record["transcript"] for record in records if record["record_type"] == "check_in"] == [
+        "Feeling better, slight headache"
+    ]
+
+def test_partly_read_export_does_not_block_writes(tmp_path):
+    """Test that another session can commit while an export is only partly consumed"""
+    # No busy timeout, so a held read lock fails the write immediately
+    engine = create_engine(f"sqlite:///{tmp_path / 'export.db'}", connect_args={"timeout": 0})
+    models.Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    reader, writer = factory(), factory()
+    writer.add(models.User(email="test@example.com", full_name="Test User"))
+    writer.commit()
+    writer.add_all([
+        models.Usage(user_id=1, prescription_id=1, taken_at=datetime(2024, 1, 1, 8) + timedelta(days=day))
+        for day in range(50)
+    ])
+    writer.commit()
+
+    records = iter_user_records(reader, 1, batch_size=7)
+    exported = [next(records) for _ in range(10)]
+    writer.add(models.Usage(user_id=1, prescription_id=1, taken_at=datetime(2024, 6, 1, 8)))
+    writer.commit()
+    exported += list(records)
+    reader.close()
+    writer.close()
+    engine.dispose()
+
+    usage_ids = [fields["id"] for record_type, fields in exported if record_type == "usage"]
+    assert usage_ids == list(range(1, 52))
+
+def test_csv_export_gzip(db, user):
+    """Test that the gzip-compressed CSV export decompresses to all records"""
+    text = _read(stream_user_export(db, user.id, "csv", compress=True, batch_size=7), compressed=True)
+    rows = list(csv.DictReader(io.StringIO(text)))
+
+    assert len(rows) == 63
+    assert rows[1]["medication_name"] == "Test Medication"
+    assert json.loads(rows[-1]["side_effects"]) == ["headache"]
+
+def test_export_includes_archived_usage(db, user):
+    """Test that compacted usage is exported alongside live usage"""
+    before = _read(stream_user_export(db, user.id, "ndjson"))
+
+    usage_archive.compact_usage(db, horizon_days=0, now=datetime(2024, 2, 15))
+
+    assert db.query(models.UsageArchive).count() == 1
+    assert _read(stream_user_export(db, user.id, "ndjson")) == before
+
+def test_export_unknown_format(db, user):
+    """Test that an unsupported format is rejected"""
+    with pytest.raises(ValueError):
+        stream_user_export(db, user.id, "xml")
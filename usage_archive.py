@@ -0,0 +1,501 @@
+"""
+Cold-history compaction of usage logs.
+
+The `usage` table gains a row per dose forever, but old rows are only read
+back for adherence and history listings. This module compacts every whole
+month older than a configurable horizon into a single `usage_archive` row per
+(user, prescription, month) holding:
+
+- a per-day/per-slot taken bitmap (bit `day * slots_per_day + slot`), enough
+  to answer adherence without decoding individual doses, and
+- a varint-packed list of every dose with its original id and exact
+  `taken_at`/`created_at` timestamps, so nothing is lost.
+
+Readers should go through `get_usage_logs` and `usage_counts_by_date`, which
+merge the archived and live tiers transparently.
+
+Archived doses keep their ids, so the `usage` table must never reuse the ids
+of deleted rows. Tables created before the archive tier need a one-off
+rebuild with AUTOINCREMENT first:
+
+    python usage_archive.py --enable-autoincrement
+
+Run the job from the command line:
+
+    python usage_archive.py --horizon-days 365
+"""
+import argparse
+import calendar
+import logging
+import os
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+import models
+import schemas
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HORIZON_DAYS = int(os.getenv("USAGE_ARCHIVE_HORIZON_DAYS", "365"))
+
+# (id, taken_at, created_at)
+Dose = Tuple[int, datetime, Optional[datetime]]
+
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class CompactionResult:
+    def __init__(
+        self,
+        cutoff: datetime,
+        rows_archived: int,
+        months_written: int
+    ):
+        self.cutoff = cutoff
+        self.rows_archived = rows_archived
+        self.months_written = months_written
+
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def next_month(value: datetime) -> datetime:
+    if value.month == 12:
+        return datetime(value.year + 1, 1, 1)
+    return datetime(value.year, value.month + 1, 1)
+
+
+def days_in_month(month: datetime) -> int:
+    return calendar.monthrange(month.year, month.month)[1]
+
+
+# ---------------------------------------------------------------------------
+# Binary encoding
+# ---------------------------------------------------------------------------
+
+def _put_varint(buf: bytearray, value: int) -> None:
+    while value >= 0x80:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _get_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) if value >= 0 else ((-value << 1) - 1)
+
+
+def _unzigzag(value: int) -> int:
+    return (value >> 1) if not value & 1 else -((value + 1) >> 1)
+
+
+def _put_delta(buf: bytearray, delta: timedelta) -> None:
+    # Whole seconds carry a flag bit; the microsecond part is only written
+    # when non-zero, which keeps the common case to a few bytes.
+    seconds, micros = divmod(delta // _MICROSECOND, 1_000_000)
+    _put_varint(buf, (_zigzag(seconds) << 1) | (1 if micros else 0))
+    if micros:
+        _put_varint(buf, micros)
+
+
+def _get_delta(data: bytes, pos: int) -> Tuple[timedelta, int]:
+    header, pos = _get_varint(data, pos)
+    micros = 0
+    if header & 1:
+        micros, pos = _get_varint(data, pos)
+    return timedelta(seconds=_unzigzag(header >> 1), microseconds=micros), pos
+
+
+def encode_doses(month: datetime, doses: Iterable[Dose]) -> bytes:
+    """
+    Pack doses (sorted by taken_at) as varints relative to the previous dose.
+
+    Each dose is written as: id delta, taken_at delta, created_at - taken_at.
+    A missing created_at is stored as a flag so it round-trips as None.
+    """
+    buf = bytearray()
+    prev_id = 0
+    prev_taken = month
+    for dose_id, taken_at, created_at in doses:
+        _put_varint(buf, _zigzag(dose_id - prev_id))
+        _put_delta(buf, taken_at - prev_taken)
+        if created_at is None:
+            buf.append(0)
+        else:
+            buf.append(1)
+            _put_delta(buf, created_at - taken_at)
+        prev_id = dose_id
+        prev_taken = taken_at
+    return bytes(buf)
+
+
+def decode_doses(month: datetime, data: bytes) -> List[Dose]:
+    doses = []
+    pos = 0
+    prev_id = 0
+    prev_taken = month
+    while pos < len(data):
+        id_delta, pos = _get_varint(data, pos)
+        taken_delta, pos = _get_delta(data, pos)
+        dose_id = prev_id + _unzigzag(id_delta)
+        taken_at = prev_taken + taken_delta
+        has_created = data[pos]
+        pos += 1
+        created_at = None
+        if has_created:
+            created_delta, pos = _get_delta(data, pos)
+            created_at = taken_at + created_delta
+        doses.append((dose_id, taken_at, created_at))
+        prev_id = dose_id
+        prev_taken = taken_at
+    return doses
+
+
+def encode_bitmap(month: datetime, slots_per_day: int, doses: Iterable[Dose]) -> bytes:
+    """Set one bit per taken dose, in order of intake within each day."""
+    bitmap = bytearray((days_in_month(month) * slots_per_day + 7) // 8)
+    taken_per_day: Dict[int, int] = defaultdict(int)
+    for _, taken_at, _ in doses:
+        day = taken_at.day - 1
+        slot = taken_per_day[day]
+        taken_per_day[day] += 1
+        if slot < slots_per_day:
+            bit = day * slots_per_day + slot
+            bitmap[bit >> 3] |= 1 << (bit & 7)
+    return bytes(bitmap)
+
+
+def bitmap_counts(month: datetime, slots_per_day: int, bitmap: bytes) -> Dict[date, int]:
+    """Number of taken slots per day according to the bitmap."""
+    counts = {}
+    for day in range(days_in_month(month)):
+        taken = 0
+        for slot in range(slots_per_day):
+            bit = day * slots_per_day + slot
+            if bitmap[bit >> 3] & (1 << (bit & 7)):
+                taken += 1
+        if taken:
+            counts[date(month.year, month.month, day + 1)] = taken
+    return counts
+
+
+def _popcount(data: bytes) -> int:
+    return bin(int.from_bytes(data, "little")).count("1")
+
+
+# ---------------------------------------------------------------------------
+# Compaction job
+# ---------------------------------------------------------------------------
+
+def _write_month(
+    db: Session,
+    user_id: int,
+    prescription_id: int,
+    month: datetime,
+    slots_per_day: int,
+    doses: List[Dose]
+) -> None:
+    archive = db.query(models.UsageArchive).filter(
+        models.UsageArchive.user_id == user_id,
+        models.UsageArchive.prescription_id == prescription_id,
+        models.UsageArchive.month == month
+    ).first()
+
+    if archive is None:
+        archive = models.UsageArchive(
+            user_id=user_id,
+            prescription_id=prescription_id,
+            month=month,
+            slots_per_day=slots_per_day
+        )
+        db.add(archive)
+    else:
+        # Late-arriving rows for an already archived month are merged in
+        doses = decode_doses(month, archive.doses) + doses
+        slots_per_day = archive.slots_per_day
+
+    doses.sort(key=lambda dose: (dose[1], dose[0]))
+    archive.dose_count = len(doses)
+    archive.taken_bitmap = encode_bitmap(month, slots_per_day, doses)
+    archive.doses = encode_doses(month, doses)
+
+
+def usage_ids_are_stable(db: Session) -> bool:
+    """Whether ids of deleted usage rows can never be handed out again."""
+    if db.get_bind().dialect.name != "sqlite":
+        return True
+    # Without AUTOINCREMENT SQLite assigns max(rowid) + 1, reusing archived ids
+    table_sql = db.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'usage'")
+    ).scalar()
+    return table_sql is not None and "AUTOINCREMENT" in table_sql.upper()
+
+
+def enable_usage_autoincrement(engine: Engine) -> bool:
+    """
+    Rebuild an existing `usage` table with AUTOINCREMENT.
+
+    The id sequence is started after the highest id in either tier. The table
+    is copied in one exclusive transaction, so this is a one-off maintenance
+    step. Returns False if the table did not need rebuilding.
+    """
+    table = models.Usage.__table__
+    with engine.connect() as connection:
+        table_sql = connection.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'usage'")
+        ).scalar()
+        if table_sql is None or "AUTOINCREMENT" in table_sql.upper():
+            return False
+        archived_max_id = 0
+        for month, data in connection.execute(select(models.UsageArchive.month, models.UsageArchive.doses)):
+            archived_max_id = max([archived_max_id] + [dose[0] for dose in decode_doses(month, data)])
+        create_statements = [str(CreateTable(table).compile(engine))] + [
+            str(CreateIndex(index).compile(engine)) for index in table.indexes
+        ]
+
+    columns = ", ".join(column.name for column in table.columns)
+    script = "\n".join(
+        ["BEGIN IMMEDIATE;", "ALTER TABLE usage RENAME TO usage_legacy;"]
+        + [f"DROP INDEX IF EXISTS {index.name};" for index in table.indexes]
+        + [f"{statement.strip()};" for statement in create_statements]
+        + [
+            f"INSERT INTO usage ({columns}) SELECT {columns} FROM usage_legacy;",
+            "DROP TABLE usage_legacy;",
+            "DELETE FROM sqlite_sequence WHERE name = 'usage';",
+            "INSERT INTO sqlite_sequence (name, seq) "
+            f"VALUES ('usage', MAX(COALESCE((SELECT MAX(id) FROM usage), 0), {int(archived_max_id)}));",
+            "COMMIT;",
+        ]
+    )
+    # The rename and copy must be atomic, which pysqlite's implicit transactions
+    # do not give DDL, so run it as one script on the driver connection
+    pooled = engine.raw_connection()
+    try:
+        pooled.driver_connection.executescript(script)
+    finally:
+        pooled.close()
+    logger.info(f"Rebuilt usage table with AUTOINCREMENT, next id after {archived_max_id}")
+    return True
+
+
+def compact_usage(
+    db: Session,
+    horizon_days: int = DEFAULT_HORIZON_DAYS,
+    now: Optional[datetime] = None
+) -> CompactionResult:
+    """
+    Move usage rows older than the horizon into the archive tier.
+
+    Only whole months are archived: the cutoff is the start of the month
+    containing `now - horizon_days`. Each (user, prescription) pair is
+    compacted and committed in its own transaction so the job can be
+    interrupted and re-run safely. Refuses to run while the usage table
+    could reuse archived ids (see `enable_usage_autoincrement`).
+    """
+    if not usage_ids_are_stable(db):
+        raise RuntimeError(
+            "The usage table can reuse deleted ids; run "
+            "`python usage_archive.py --enable-autoincrement` before compacting"
+        )
+    now = now or datetime.now()
+    cutoff = month_start(now - timedelta(days=horizon_days))
+
+    pairs = db.query(
+        models.Usage.user_id,
+        models.Usage.prescription_id,
+        models.Prescription.times_per_day
+    ).outerjoin(
+        models.Prescription, models.Prescription.id == models.Usage.prescription_id
+    ).filter(
+        models.Usage.taken_at < cutoff,
+        models.Usage.user_id.isnot(None),
+        models.Usage.prescription_id.isnot(None)
+    ).distinct().all()
+
+    rows_archived = 0
+    months_written = 0
+    for user_id, prescription_id, times_per_day in pairs:
+        old_usage = db.query(models.Usage).filter(
+            models.Usage.user_id == user_id,
+            models.Usage.prescription_id == prescription_id,
+            models.Usage.taken_at < cutoff
+        )
+        rows = old_usage.with_entities(
+            models.Usage.id, models.Usage.taken_at, models.Usage.created_at
+        ).order_by(models.Usage.taken_at, models.Usage.id).all()
+
+        by_month: Dict[datetime, List[Dose]] = defaultdict(list)
+        for dose_id, taken_at, created_at in rows:
+            by_month[month_start(taken_at)].append((dose_id, taken_at, created_at))
+
+        slots_per_day = max(times_per_day or 1, 1)
+        for month, doses in by_month.items():
+            _write_month(db, user_id, prescription_id, month, slots_per_day, doses)
+
+        old_usage.delete(synchronize_session=False)
+        db.commit()
+
+        rows_archived += len(rows)
+        months_written += len(by_month)
+
+    logger.info(
+        f"Archived {rows_archived} usage rows into {months_written} monthly rows (cutoff {cutoff})"
+    )
+    return CompactionResult(cutoff=cutoff, rows_archived=rows_archived, months_written=months_written)
+
+
+# ---------------------------------------------------------------------------
+# Tier-transparent readers
+# ---------------------------------------------------------------------------
+
+def _archive_query(
+    db: Session,
+    user_id: int,
+    prescription_id: Optional[int],
+    start_date: Optional[datetime],
+    end_date: Optional[datetime]
+):
+    query = db.query(models.UsageArchive).filter(models.UsageArchive.user_id == user_id)
+    if prescription_id is not None:
+        query = query.filter(models.UsageArchive.prescription_id == prescription_id)
+    if start_date:
+        query = query.filter(models.UsageArchive.month >= month_start(start_date))
+    if end_date:
+        query = query.filter(models.UsageArchive.month <= end_date)
+    return query
+
+
+def _live_query(
+    db: Session,
+    user_id: int,
+    prescription_id: Optional[int],
+    start_date: Optional[datetime],
+    end_date: Optional[datetime]
+):
+    query = db.query(models.Usage).filter(models.Usage.user_id == user_id)
+    if prescription_id is not None:
+        query = query.filter(models.Usage.prescription_id == prescription_id)
+    if start_date:
+        query = query.filter(models.Usage.taken_at >= start_date)
+    if end_date:
+        query = query.filter(models.Usage.taken_at <= end_date)
+    return query
+
+
+def _naive(value: Optional[datetime]) -> Optional[datetime]:
+    # Archived timestamps are naive local time; aware query bounds are converted to match
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def _in_range(value: datetime, start_date: Optional[datetime], end_date: Optional[datetime]) -> bool:
+    return (start_date is None or value >= start_date) and (end_date is None or value <= end_date)
+
+
+def get_usage_logs(
+    db: Session,
+    user_id: int,
+    prescription_id: Optional[int] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+) -> List[schemas.UsageResponse]:
+    """Usage logs from both the archived and live tiers, newest first."""
+    start_date, end_date = _naive(start_date), _naive(end_date)
+    logs = [
+        schemas.UsageResponse.model_validate(row)
+        for row in _live_query(db, user_id, prescription_id, start_date, end_date)
+    ]
+
+    for archive in _archive_query(db, user_id, prescription_id, start_date, end_date):
+        for dose_id, taken_at, created_at in decode_doses(archive.month, archive.doses):
+            if _in_range(taken_at, start_date, end_date):
+                logs.append(schemas.UsageResponse(
+                    id=dose_id,
+                    user_id=archive.user_id,
+                    prescription_id=archive.prescription_id,
+                    taken_at=taken_at,
+                    created_at=created_at
+                ))
+
+    logs.sort(key=lambda log: (log.taken_at, log.id), reverse=True)
+    return logs
+
+
+def usage_counts_by_date(
+    db: Session,
+    user_id: int,
+    prescription_id: int,
+    start_date: datetime,
+    end_date: datetime
+) -> Dict[date, int]:
+    """
+    Doses taken per day for one prescription across both tiers.
+
+    Archived months that lie entirely inside the range and contain no extra
+    doses beyond the bitmap slots are answered from the bitmap alone; the
+    rest fall back to decoding exact timestamps.
+    """
+    start_date, end_date = _naive(start_date), _naive(end_date)
+    counts: Dict[date, int] = defaultdict(int)
+
+    live = _live_query(db, user_id, prescription_id, start_date, end_date)
+    for (taken_at,) in live.with_entities(models.Usage.taken_at):
+        counts[taken_at.date()] += 1
+
+    for archive in _archive_query(db, user_id, prescription_id, start_date, end_date):
+        whole_month = archive.month >= start_date and next_month(archive.month) <= end_date
+        if whole_month and archive.dose_count == _popcount(archive.taken_bitmap):
+            for day, taken in bitmap_counts(archive.month, archive.slots_per_day, archive.taken_bitmap).items():
+                counts[day] += taken
+            continue
+        for _, taken_at, _ in decode_doses(archive.month, archive.doses):
+            if _in_range(taken_at, start_date, end_date):
+                counts[taken_at.date()] += 1
+
+    return counts
+
+
+if __name__ == "__main__":
+    from database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Compact old usage logs into monthly archive rows")
+    parser.add_argument(
+        "--horizon-days", type=int, default=DEFAULT_HORIZON_DAYS,
+        help="Archive whole months older than this many days (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--enable-autoincrement", action="store_true",
+        help="One-off: rebuild a usage table created before archiving so it never reuses ids"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    models.Base.metadata.create_all(bind=engine)
+    if args.enable_autoincrement:
+        enable_usage_autoincrement(engine)
+
+    db = SessionLocal()
+    try:
+        result = compact_usage(db, horizon_days=args.horizon_days)
+    finally:
+        db.close()
+    print(f"Archived {result.rows_archived} usage rows into {result.months_written} monthly rows before {result.cutoff}")
@@ -0,0 +1,245 @@
+"""
+Streaming full-history export for a single user.
+
+Everything a clinician may ask for (the user, prescriptions, every usage log
+across the live and archived tiers, and every check-in) is read in
+keyset-paginated batches and serialised record by record, so memory stays
+flat no matter how long the history is, and no read transaction stays open
+between batches to block other sessions' writes.
+
+    python user_export.py 42 --format csv --gzip -o patient-42.csv.gz
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+import zlib
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, Tuple
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session
+
+import models
+import usage_archive
+
+EXPORT_FORMATS = ("ndjson", "csv")
+DEFAULT_BATCH_SIZE = 5000
+# Output is coalesced into chunks of roughly this size before being yielded
+CHUNK_SIZE = 64 * 1024
+
+Record = Tuple[str, Dict[str, Any]]
+
+# Union of all record fields, used as the CSV header
+CSV_FIELDS = [
+    "record_type", "id", "user_id", "prescription_id",
+    "email", "full_name",
+    "medication_name", "dosage", "pills_per_dose", "times_per_day",
+    "special_instructions", "start_date", "end_date", "prescription_metadata", "updated_at",
+    "taken_at",
+    "date", "transcript", "side_effects", "red_flags", "mood", "clinical_effectiveness",
+    "created_at",
+]
+
+_PRESCRIPTION_COLUMNS = [
+    models.Prescription.id, models.Prescription.user_id, models.Prescription.medication_name,
+    models.Prescription.dosage, models.Prescription.pills_per_dose, models.Prescription.times_per_day,
+    models.Prescription.special_instructions, models.Prescription.start_date, models.Prescription.end_date,
+    models.Prescription.prescription_metadata, models.Prescription.created_at, models.Prescription.updated_at,
+]
+
+_USAGE_COLUMNS = [
+    models.Usage.id, models.Usage.user_id, models.Usage.prescription_id,
+    models.Usage.taken_at, models.Usage.created_at,
+]
+
+_CHECK_IN_COLUMNS = [
+    models.CheckIn.id, models.CheckIn.user_id, models.CheckIn.date, models.CheckIn.transcript,
+    models.CheckIn.side_effects, models.CheckIn.red_flags, models.CheckIn.mood,
+    models.CheckIn.clinical_effectiveness, models.CheckIn.created_at,
+]
+
+
+def _after(keys, last: Tuple[Any, ...]):
+    # Rows sorting after `last` in ORDER BY `keys`; SQLite sorts NULLs first
+    clauses = []
+    for i, (key, value) in enumerate(zip(keys, last)):
+        equal = [k.is_(None) if v is None else k == v for k, v in zip(keys[:i], last[:i])]
+        clauses.append(and_(*equal, key.isnot(None) if value is None else key > value))
+    return or_(*clauses)
+
+
+def _stream(db: Session, statement, keys, batch_size: int) -> Iterator[Dict[str, Any]]:
+    """
+    Yield rows of `statement` ordered by `keys` (ending in a unique column), a page at a time.
+
+    Each page is read completely and the session's transaction ended before
+    it is yielded, so a slow client never holds SQLite's read lock and blocks
+    other sessions' commits while the export streams.
+    """
+    last = None
+    while True:
+        page = statement if last is None else statement.where(_after(keys, last))
+        rows = db.execute(page.order_by(*keys).limit(batch_size)).mappings().all()
+        db.rollback()
+        for row in rows:
+            yield dict(row)
+        if len(rows) < batch_size:
+            return
+        last = tuple(rows[-1][key.key] for key in keys)
+
+
+def iter_user_records(db: Session, user_id: int, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[Record]:
+    """
+    Yield (record_type, fields) for a user's complete history.
+
+    Order is: user, prescriptions, archived usage (oldest month first), live
+    usage, check-ins. Only one batch of rows is held in memory at a time,
+    and the session's transaction is ended after reading each batch.
+    """
+    user = db.execute(
+        select(models.User.id, models.User.email, models.User.full_name, models.User.created_at)
+        .where(models.User.id == user_id)
+    ).mappings().first()
+    if user is None:
+        return
+    yield "user", dict(user)
+
+    prescriptions = select(*_PRESCRIPTION_COLUMNS).where(
+        models.Prescription.user_id == user_id
+    )
+    for row in _stream(db, prescriptions, [models.Prescription.id], batch_size):
+        yield "prescription", row
+
+    # A month packs at most a few hundred doses, so small archive batches suffice
+    archives = select(
+        models.UsageArchive.user_id, models.UsageArchive.prescription_id,
+        models.UsageArchive.month, models.UsageArchive.doses
+    ).where(
+        models.UsageArchive.user_id == user_id
+    )
+    archive_keys = [models.UsageArchive.month, models.UsageArchive.prescription_id]
+    for archive in _stream(db, archives, archive_keys, max(batch_size // 100, 1)):
+        for dose_id, taken_at, created_at in usage_archive.decode_doses(archive["month"], archive["doses"]):
+            yield "usage", {
+                "id": dose_id,
+                "user_id": archive["user_id"],
+                "prescription_id": archive["prescription_id"],
+                "taken_at": taken_at,
+                "created_at": created_at,
+            }
+
+    usage = select(*_USAGE_COLUMNS).where(
+        models.Usage.user_id == user_id
+    )
+    for row in _stream(db, usage, [models.Usage.taken_at, models.Usage.id], batch_size):
+        yield "usage", row
+
+    # Check-ins still being streamed are left out until they are finalized
+    check_ins = select(*_CHECK_IN_COLUMNS).where(
+        models.CheckIn.user_id == user_id,
+        models.CheckIn.id.not_in(select(models.CheckInDraft.check_in_id))
+    )
+    for row in _stream(db, check_ins, [models.CheckIn.date, models.CheckIn.id], batch_size):
+        yield "check_in", row
+
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return value
+
+
+def iter_ndjson(records: Iterable[Record]) -> Iterator[str]:
+    for record_type, fields in records:
+        yield json.dumps({"record_type": record_type, **fields}, default=_json_default) + "\n"
+
+
+def iter_csv(records: Iterable[Record]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    for record_type, fields in records:
+        writer.writerow({"record_type": record_type, **{k: _csv_value(v) for k, v in fields.items()}})
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _coalesce(chunks: Iterable[str], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    pending = []
+    pending_size = 0
+    for chunk in chunks:
+        pending.append(chunk)
+        pending_size += len(chunk)
+        if pending_size >= chunk_size:
+            yield "".join(pending).encode("utf-8")
+            pending = []
+            pending_size = 0
+    if pending:
+        yield "".join(pending).encode("utf-8")
+
+
+def _gzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    # wbits=31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def stream_user_export(
+    db: Session,
+    user_id: int,
+    export_format: str = "ndjson",
+    compress: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE
+) -> Iterator[bytes]:
+    """Encoded export of a user's history as a stream of byte chunks."""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+
+    records = iter_user_records(db, user_id, batch_size)
+    lines = iter_ndjson(records) if export_format == "ndjson" else iter_csv(records)
+    chunks = _coalesce(lines)
+    return _gzip(chunks) if compress else chunks
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Export a user's full history")
+    parser.add_argument("user_id", type=int)
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+    parser.add_argument("--gzip", action="store_true", help="Compress the output with gzip")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if db.query(models.User.id).filter(models.User.id == args.user_id).first() is None:
+            sys.exit(f"User {args.user_id} not found")
+
+        output = open(args.output, "wb") if args.output else sys.stdout.buffer
+        try:
+            for chunk in stream_user_export(db, args.user_id, args.format, args.gzip, args.batch_size):
+                output.write(chunk)
+        finally:
+            if args.output:
+                output.close()
+    finally:
+        db.close()